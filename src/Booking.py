@@ -1,11 +1,27 @@
+from bisect import bisect_right
+from collections.abc import Mapping
 from dataclasses import dataclass, field
-from datetime import datetime
-import requests
+from datetime import date, datetime, time, timedelta
+import cache
 import config
-import dateparser
+import metrics
 import pytz
+import timestamps
 
 
+BASE_URL = 'https://timetreeapis.com/'
+
+TIMEZONE = pytz.timezone('America/Vancouver')
+
+# most days the upcoming_events endpoint returns, from today
+UPCOMING_DAYS = 7
+
+# days of bookings a BookingIndex holds
+INDEX_DAYS = 14
+
+# most pages of upcoming events followed, in case the next links loop
+MAX_PAGES = 20
+
 @dataclass 
 class Booking:
     title: str
@@ -19,33 +35,156 @@ class Booking:
         return f'{self.title} from {start} to {end}'
 
 
-def get_bookings(cal_id) -> list:
+@metrics.instrument
+def get_bookings(cal_id, timeout: float = None) -> list:
     '''
     Retrieve bookings from timetree's API upcoming_events endpoint
     Returns only current days upcoming bookings
     '''
-    token = config.CONFIG['personal access token']
-    base_url = 'https://timetreeapis.com/'
-
-    res = requests.get( f'{base_url}/calendars/{cal_id}/upcoming_events',
-        headers = {
-            'accept': 'application/vnd.timetree.v1+json',
-            'Authorization': f'Bearer {token}'
-        },
-        params = {
-            'timezone': 'America/Vancouver'
-        })
+    today = timestamps.today()
+    return get_bookings_range(cal_id, today, 1, timeout).get(today, [])
 
-    try:
-        raw_bookings = res.json()['data']
-        bookings = [create_booking_obj(raw) for raw in raw_bookings]
 
-        return [booking for booking in bookings if \
-               booking.start_at.day == datetime.now().day]
+@metrics.instrument
+def get_bookings_range(cal_id, start: date, days: int,
+                       timeout: float = None) -> 'BookingIndex':
+    '''
+    Retrieve the bookings for each of the days from start from the
+    upcoming_events endpoint, which covers at most the coming week, following
+    the response's next links when it is split into pages
+    Returns the bookings keyed by date, an empty dict if they couldn't be read
+    '''
+    pages = fetch_upcoming_events(cal_id, start, days, timeout)
+    try:
+        return parse_upcoming_events(pages, start, days)
     except KeyError as error:
         print("ERROR: Unable to retrieve Booking Data")
-        return []
-        
+        metrics.annotate(error=f'no {error} in TimeTree response')
+        return {}
+
+
+def fetch_upcoming_events(cal_id, start: date, days: int,
+                          timeout: float = None) -> list[dict]:
+    '''
+    The pages of the upcoming_events response covering the days from start,
+    as decoded JSON
+    '''
+    token = config.CONFIG.personal_access_token
+
+    # upcoming events always begin today, ask for no more days than needed,
+    # and no more than the endpoint allows
+    upcoming_days = min(max((start - timestamps.today()).days + days, 1),
+                        UPCOMING_DAYS)
+
+    url = f'{BASE_URL}/calendars/{cal_id}/upcoming_events'
+    params = {'timezone': 'America/Vancouver', 'days': upcoming_days}
+    headers = {
+        'accept': 'application/vnd.timetree.v1+json',
+        'Authorization': f'Bearer {token}'
+    }
+    pages = []
+    for _ in range(MAX_PAGES):
+        res = cache.get('bookings', url, params=params, headers=headers,
+                        timeout=timeout)
+        pages.append(res.json())
+
+        # the next link already carries the query
+        url, params = (pages[-1].get('links') or {}).get('next'), None
+        if not url:
+            break
+    return pages
+
+
+def parse_upcoming_events(pages: list[dict], start: date,
+                          days: int) -> 'BookingIndex':
+    '''
+    The bookings for each of the days from start in the pages of an
+    upcoming_events response, keyed by date
+    Raises KeyError when a page has no events, as in an error response
+    '''
+    index = BookingIndex()
+    for page in pages:
+        index.add(page['data'], start, days)
+    return index
+
+
+class BookingIndex(Mapping):
+    '''
+    TimeTree events grouped by the local date they start on, in a single pass
+    which skips events outside the days asked for before parsing them.
+    Booking objects are only built for a day once it is looked up.
+    Holds at most max_days days, the earliest are dropped to make room
+    '''
+
+    def __init__(self, max_days: int = INDEX_DAYS):
+        self.max_days = max_days
+
+        # date -> raw events, replaced by their Bookings once looked up
+        self._days: dict[date, list] = {}
+        self._built: set[date] = set()
+
+    def add(self, raw_events: list, start: date, days: int):
+        '''
+        Index the events starting on the days from start, each of the days
+        is in the index afterwards even when it has no bookings
+        '''
+        window = [start + timedelta(days=i) for i in range(days)]
+        for day in window:
+            self._days.setdefault(day, [])
+
+        # TimeTree's timestamps are all UTC in the same format, so they can
+        # be compared as strings against the UTC time each local day begins
+        first, last = window[0].isoformat(), window[-1].isoformat()
+        bounds = [_utc_midnight(day) for day in window]
+        bounds.append(_utc_midnight(window[-1] + timedelta(days=1)))
+
+        for raw in raw_events:
+            start_at = raw['attributes']['start_at']
+            if raw['attributes']['all_day']:
+                if first <= start_at[:10] <= last:
+                    self._days[date.fromisoformat(start_at[:10])].append(raw)
+            elif start_at.endswith('Z'):
+                i = bisect_right(bounds, start_at[:19]) - 1
+                if 0 <= i < days:
+                    self._days[window[i]].append(raw)
+            else:
+                # not the usual format, parse it to find its day
+                booking = create_booking_obj(raw)
+                if booking.start_at.date() in window:
+                    self._days[booking.start_at.date()].append(raw)
+
+        # days already looked up get the new events as Bookings
+        for day in self._built.intersection(window):
+            self._days[day] = [event if isinstance(event, Booking)
+                               else create_booking_obj(event)
+                               for event in self._days[day]]
+
+        while len(self._days) > self.max_days:
+            earliest = min(self._days)
+            del self._days[earliest]
+            self._built.discard(earliest)
+
+    def __getitem__(self, day: date) -> list[Booking]:
+        if day not in self._built:
+            self._days[day] = [create_booking_obj(raw)
+                               for raw in self._days[day]]
+            self._built.add(day)
+        return self._days[day]
+
+    def __contains__(self, day) -> bool:
+        return day in self._days
+
+    def __iter__(self):
+        return iter(self._days)
+
+    def __len__(self):
+        return len(self._days)
+
+
+def _utc_midnight(day: date) -> str:
+    '''when day begins in Vancouver, as TimeTree writes UTC timestamps'''
+    return TIMEZONE.localize(datetime.combine(day, time())) \
+        .astimezone(pytz.utc).strftime('%Y-%m-%dT%H:%M:%S')
 
 
 def create_booking_obj(raw_event: dict) -> Booking:
@@ -58,11 +197,10 @@ def create_booking_obj(raw_event: dict) -> Booking:
     all_day = raw_event['attributes']['all_day']
 
     #  Timetree's API has start and end time for all day events as 00:00:00 UTC
-    start = dateparser.parse(raw_event['attributes']['start_at'])
-    end = dateparser.parse(raw_event['attributes']['end_at'])
+    start = timestamps.parse_iso(raw_event['attributes']['start_at'])
+    end = timestamps.parse_iso(raw_event['attributes']['end_at'])
     if not all_day:
-        timezone = pytz.timezone('America/Vancouver')
-        start = start.astimezone(timezone)
-        end = end.astimezone(timezone)
+        start = start.astimezone(TIMEZONE)
+        end = end.astimezone(TIMEZONE)
 
     return Booking(title, all_day, start, end)
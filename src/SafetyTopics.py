@@ -1,9 +1,10 @@
-# Some of the variables in this file likely shouldn't be hard coded
-# and should moved into the config file
-# such as:
-#  temp for heat exhaustion warning
+# The safety topics are generated by the rules in rules.py, which can be
+# overridden with "safety rules" in the config file
 from time import strftime
 from Weather import Weather
+import config
+import metrics
+import rules
 
 class SafetyTopics:
 
@@ -18,42 +19,18 @@ class SafetyTopics:
       self.doc = document
       self._fill()
 
+   @metrics.instrument
    def _fill(self):
       '''
       generate all relevant safety topic strings for the day and append
       them to the topics list
       '''
-      self.heat_exhaustion()
-      self.tide_too_low_for_woods()
-      self.uv_index()
+      series = rules.day_series(self.doc.weather, self.doc.tides['hourly'],
+                                self.doc.tides['high and low'],
+                                self.doc.tides['neighbours'])
+      engine = rules.engine(config.CONFIG.safety_rules)
+      self.topics.extend(engine.evaluate(series))
 
-   def heat_exhaustion(self):
-
-      if self.doc.weather and \
-                  any(hour.temp >= 30 for hour in self.doc.weather):
-         pt1 = 'Watch out for Heat Exhaustion. Alternate staff working' 
-         pt2 = ' in the sun, drink plenty of water'
-         self.topics.append(pt1 + pt2)
-
-   def tide_too_low_for_woods(self):
-      woods_inaccessible = [tide for tide in self.doc.tides['hourly'] if \
-                 tide.is_too_low_for_woods()]
-      if any(tide.is_within_operational_hours() \
-                 for tide in woods_inaccessible):
-         start = woods_inaccessible[0].time.strftime('%I %p').strip('0')
-         end = woods_inaccessible[-1].time.strftime('%I %p').strip('0')
-         pt1 = 'Tides too low to access channel behind Woods Island'
-         pt2 = f' from {start} to {end}'
-         self.topics.append(pt1 + pt2)
-
-   def uv_index(self):
-      danger = 3;
-      dangerous_hours = list(filter(lambda hr : hr.uv >= danger, self.doc.weather))
-      if (len(dangerous_hours) > 0):
-         for split in split_hours(dangerous_hours):
-            warning = f'Wear sunscreen. The UV-index is high today from {split[0].date.strftime("%I %p").strip("0")} until {split[-1].date.strftime("%I %p").strip("0")}'
-            self.topics.append(warning)
-            
 
 # needs to be tested still
 def split_hours(hrs):
@@ -1,9 +1,20 @@
 from dataclasses import dataclass
-from datetime import datetime
-from bs4 import BeautifulSoup
-import requests
-import dateparser
+from datetime import date, datetime, timedelta
+from html.parser import HTMLParser
+from typing import Iterable
+import codecs
 
+import cache
+import hourly
+import metrics
+import timestamps
+
+
+URL = 'https://tides.gc.ca/en/stations/{station}'
+HOURLY_TABLE_ID = 'readings-list-hourly-heights'
+
+# bytes of the station page fed to the parser at a time
+CHUNK_SIZE = 16 * 1024
 
 
 @dataclass
@@ -31,46 +42,158 @@ class Tide:
         return str(self)
 
 
-def get_tides() -> list:
+@metrics.instrument
+def get_tides(timeout: float = None, station: str = '7460') -> dict:
     '''Retreive today's tides from 'Fisheries and Oceans Canada'.'''
-    url = 'https://tides.gc.ca/en/stations/7460'
-    res = requests.get(url)
-    soup = BeautifulSoup(res.content, 'html.parser')
+    today = timestamps.today()
+    return get_tide_range(today, 1, timeout, station)[today]
+
+@metrics.instrument
+def get_tide_range(start: date, days: int, timeout: float = None,
+                   station: str = '7460') -> dict:
+    '''
+    Retrieve the tides for each of the days from start with a single
+    download of the station page, which covers the coming week
+    Returns a dict of tides keyed by date, days missing from the page are
+    left out
+    '''
+    return parse_tide_range(fetch_tide_page(timeout, station), start, days)
+
+def fetch_tide_page(timeout: float = None, station: str = '7460'):
+    '''the response for the station page'''
+    return cache.get('tides', URL.format(station=station), timeout=timeout)
+
+def parse_tide_range(res, start: date, days: int) -> dict:
+    '''
+    The tides for each of the days from start on the station page in res
+    Returns a dict of tides keyed by date, days missing from the page are
+    left out
+    '''
+    # the days either side are read for the ends of each day's tide curve
+    dates = [start + timedelta(days=i) for i in range(-1, days + 1)]
+    table_ids = {day: day.strftime('day-table-%Y-%m-%d') for day in dates}
+    tables = parse_tide_page(res.iter_content(CHUNK_SIZE),
+                             [*table_ids.values(), HOURLY_TABLE_ID])
+    high_and_low = {day: parse_high_and_low_tides(tables[table_ids[day]], day)
+                    for day in dates if table_ids[day] in tables}
     tides = {}
-    tides['high and low'] = parse_high_and_low_tides(soup)
-    tides['hourly'] = parse_hourly_tides(soup)
+    for day in dates[1:-1]:
+        if day not in high_and_low:
+            continue
+        tides[day] = {
+            'high and low': high_and_low[day],
+            'hourly': parse_hourly_tides(tables[HOURLY_TABLE_ID], day),
+            'neighbours': neighbouring_tides(high_and_low, day),
+        }
     return tides
 
-def parse_high_and_low_tides(soup: BeautifulSoup) -> list:
-    tide_table_id = datetime.now().strftime('day-table-%Y-%m-%d')
-    todays_table = soup.find(id=tide_table_id) 
-    table_rows = todays_table.tbody.find_all('tr')
-
-    time = [row.find_all('td')[0] for row in table_rows]
-    meters = [row.find_all('td')[1] for row in table_rows]
-    feet = [row.find_all('td')[2] for row in table_rows]
-    return [Tide(dateparser.parse(
-                    time[i].text), 
-                    float(meters[i].text),
-                    float(feet[i].text,)) \
-            for i in range(len(time))]
-
-def parse_hourly_tides(soup: BeautifulSoup) -> list:
-    table = soup.find(id="readings-list-hourly-heights").tbody
+def parse_tide_page(chunks: Iterable[bytes], table_ids: list[str]) -> dict:
+    '''
+    Extract the body rows of the tables with the given ids from the station
+    page, as lists of cell text. Stops reading chunks once every table has
+    been found, tables which weren't found are left out of the result
+    '''
+    parser = TablePageParser(table_ids)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+    return parser.tables
+
+def neighbouring_tides(high_and_low: dict[date, list], day: date) -> list:
+    '''
+    The last high or low of the day before day and the first of the day
+    after, those which are in high_and_low, so day's tide curve runs on
+    past its own first and last
+    '''
+    before = high_and_low.get(day - timedelta(days=1), [])
+    after = high_and_low.get(day + timedelta(days=1), [])
+    return before[-1:] + after[:1]
+
+def parse_high_and_low_tides(rows: list[list[str]], day: date = None) -> list:
+    return [Tide(timestamps.parse_clock(time, day), float(meters), float(feet))
+            for time, meters, feet, *_ in rows]
+
+def parse_hourly_tides(rows: list[list[str]], day: date = None) -> 'hourly.TideSeries':
+    day = day or timestamps.today()
+
+    # each row is a day, starting from today
+    row = next((row for row in rows if row[0] == day.isoformat()), None)
+    if row is None:
+        offset = (day - timestamps.today()).days
+        if not 0 <= offset < len(rows):
+            raise ValueError(f'no hourly tides for {day}')
+        row = rows[offset]
 
     # exclude the first td, which contains the date
-    raw_tides = table.find('tr').find_all('td')[1:]
-    tides = list()
+    raw_tides = row[1:]
+    tides = hourly.TideSeries(timestamps.midnight(day))
     for i in range(24):
-        date = dateparser.parse('midnight today').replace(hour=i)
 
         # Handle a blank td in table row
-        if raw_tides[i].text == '':
-           meters = None
-           feet = None
-        else:
-           meters = float(raw_tides[i].text)
-           feet = '%.1f'%(meters * 3.2808)
-
-        tides.append(Tide(date, meters, feet))
+        tides.append(float(raw_tides[i]) if raw_tides[i] != '' else None)
     return tides
+
+
+class TablePageParser(HTMLParser):
+    '''
+    Incremental HTML parser which only keeps the text of the body cells of
+    the wanted tables, rather than building a tree of the whole page
+    '''
+
+    def __init__(self, table_ids: list[str]):
+        super().__init__()
+        self.wanted = set(table_ids)
+        self.tables: dict[str, list[list[str]]] = {}
+
+        # id of the table currently being read and how many tables deep
+        self._table = None
+        self._depth = 0
+        self._in_body = False
+        self._row = None
+        self._cell = None
+
+    @property
+    def done(self) -> bool:
+        return self._table is None and self.wanted.issubset(self.tables)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            if self._table:
+                self._depth += 1
+            elif dict(attrs).get('id') in self.wanted:
+                self._table = dict(attrs)['id']
+                self._depth = 1
+                self.tables[self._table] = []
+        elif self._table is None or self._depth != 1:
+            return
+        elif tag == 'tbody':
+            self._in_body = True
+        elif tag == 'tr' and self._in_body:
+            self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if self._table is None:
+            return
+        if tag == 'table':
+            self._depth -= 1
+            if self._depth == 0:
+                self._table = None
+                self._in_body = False
+        elif self._depth != 1:
+            return
+        elif tag in ('td', 'th') and self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self.tables[self._table].append(self._row)
+            self._row = None
+        elif tag == 'tbody':
+            self._in_body = False
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
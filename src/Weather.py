@@ -1,9 +1,15 @@
 from dataclasses import dataclass
-from datetime import datetime
-import dateparser
-import requests
+from datetime import date, datetime, timedelta
 from math import ceil
 
+import cache
+import hourly
+import metrics
+import timestamps
+
+
+URL = "http://api.weatherapi.com/v1/forecast.json"
+
 
 @dataclass
 class Weather:
@@ -25,28 +31,84 @@ class Weather:
         return ' - '.join(attrs)
 
 
-def get_api_weather(start_time: int, end_time: int, api_key: str) -> list[Weather]:
+@metrics.instrument
+def get_api_weather(start_time: int, end_time: int, api_key: str,
+                    timeout: float = None,
+                    location: str = 'ladysmith') -> list[Weather]:
    """
    start_time: in 24 hour format, the first hour to get weather data for
    end_time: in 24 hour format, the last hour to get weather data for
+   timeout: seconds to wait on the weather API before giving up
+   location: town, postal code or lat,lon to get the forecast for
 
    gets weather data from start time to end time from weather api
-   return a list of all weather objects created
+   return a sequence of weather objects, one per hour
+   """
+   today = timestamps.today()
+   return get_api_weather_range(start_time, end_time, api_key,
+                                today, 1, timeout, location).get(today, [])
+
+
+@metrics.instrument
+def get_api_weather_range(start_time: int, end_time: int, api_key: str,
+                          start: date, days: int, timeout: float = None,
+                          location: str = 'ladysmith') -> dict[date, 'hourly.WeatherSeries']:
+   """
+   gets weather data from start time to end time for each of the days from
+   start in a single forecast request
+
+   return a dict of hourly weather series keyed by date, days past the
+   end of the forecast are left out
+   """
+   forecast = get_forecast(api_key, start, days, timeout, location)
+   dates = [start + timedelta(days=i) for i in range(days)]
+   return {day: forecast.window(day, start_time, end_time)
+           for day in dates if day in forecast}
+
+
+@metrics.instrument
+def get_forecast(api_key: str, start: date, days: int, timeout: float = None,
+                 location: str = 'ladysmith') -> 'hourly.Forecast':
+   """
+   gets every hour of the forecast up to the last of the days from start
+   in a single request, windows of hours of any of its days are then cut
+   from it without fetching again
+
+   return an hourly.Forecast, which is keyed by date
+   """
+
+   return parse_forecast(fetch_forecast(api_key, start, days, timeout,
+                                        location))
+
+
+def fetch_forecast(api_key: str, start: date, days: int,
+                   timeout: float = None, location: str = 'ladysmith'):
+   """
+   return the forecast response for every day up to the last of the days
+   from start
    """
 
-   # TODO: load town from database
-   url = "http://api.weatherapi.com/v1/forecast.json"
-   res = requests.get(url, params={
-         "q": "ladysmith", 
-         "key": api_key
-      })
-   hourly_wx = []
+   # the forecast always begins today
+   offset = (start - timestamps.today()).days
+
+   return cache.get('weather', URL, params={
+         "q": location,
+         "key": api_key,
+         "days": offset + days,
+
+         # leave out the air quality and alerts, which aren't used
+         "aqi": "no",
+         "alerts": "no",
+      }, timeout=timeout)
+
+
+def parse_forecast(res) -> 'hourly.Forecast':
+   """
+   return the hours of a forecast response as an hourly.Forecast
+   """
 
    # TODO: Add error checking for a bad response
-   hours: list = res.json()['forecast']['forecastday'][0]['hour']
-   for hour in hours[start_time:end_time + 1]:
-      hourly_wx.append(parse_api_hour(hour))
-   return hourly_wx
+   return hourly.Forecast.from_api_days(res.json()['forecast']['forecastday'])
 
 
 def parse_api_hour(hour: dict) -> Weather:
@@ -54,7 +116,7 @@ def parse_api_hour(hour: dict) -> Weather:
     given a dict contain the raw output from the weather API,
     create a weather object and return it
     """
-    date = dateparser.parse(hour['time'])
+    date = timestamps.parse_iso(hour['time'])
     description = hour['condition']['text']
 
     # icon is originally a url, [20:] remove upto the ....com/ from the url
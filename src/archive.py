@@ -0,0 +1,272 @@
+"""
+local archive of every document's data
+
+each run's tides, weather, bookings and safety topics are appended to an
+SQLite database, so questions about past days, like how many mornings the
+channel behind Woods Island was closed during operating hours, can be
+answered without the upstreams, which only cover the coming week.
+
+    from archive import Archive
+    closed = Archive().low_tide_days(0.6, date(2023, 5, 1), date(2023, 9, 30))
+
+rows are written by a background thread in batches, so generating a
+document never waits on the disk. Nothing is ever updated, each document
+written adds a snapshot of its day, with only the sections whose upstream
+was fetched, and queries use the latest snapshot of a day with the section
+they read.
+Set in config.json to keep it somewhere else
+  "archive": "/path/to/archive.sqlite3"
+"""
+
+from datetime import date, datetime
+from pathlib import Path
+import queue
+import sqlite3
+import threading
+
+
+ARCHIVE_PATH = Path(__file__).absolute().parent.parent / 'archive.sqlite3'
+
+# most snapshots written in a single transaction
+BATCH_SIZE = 64
+
+# what a snapshot may hold, safety topics need both tides and weather
+SECTIONS = ('tides', 'weather', 'bookings', 'safety topics')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    site TEXT NOT NULL,
+    day TEXT NOT NULL,
+    archived_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_day_site ON snapshots (day, site);
+
+CREATE TABLE IF NOT EXISTS sections (
+    snapshot INTEGER NOT NULL REFERENCES snapshots,
+    section TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_section ON sections (section, snapshot);
+
+CREATE TABLE IF NOT EXISTS tides (
+    snapshot INTEGER NOT NULL REFERENCES snapshots,
+    kind TEXT NOT NULL,
+    time TEXT NOT NULL,
+    meters REAL
+);
+CREATE INDEX IF NOT EXISTS tides_snapshot ON tides (snapshot, kind);
+
+CREATE TABLE IF NOT EXISTS weather (
+    snapshot INTEGER NOT NULL REFERENCES snapshots,
+    time TEXT NOT NULL,
+    description TEXT,
+    temp INTEGER,
+    wind TEXT,
+    uv REAL
+);
+CREATE INDEX IF NOT EXISTS weather_snapshot ON weather (snapshot);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    snapshot INTEGER NOT NULL REFERENCES snapshots,
+    title TEXT NOT NULL,
+    all_day INTEGER NOT NULL,
+    start_at TEXT NOT NULL,
+    end_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_snapshot ON bookings (snapshot);
+
+CREATE TABLE IF NOT EXISTS safety_topics (
+    snapshot INTEGER NOT NULL REFERENCES snapshots,
+    topic TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS safety_topics_snapshot ON safety_topics (snapshot);
+'''
+
+# the latest snapshot with section of each site's days from start to end,
+# for any site when site is NULL
+LATEST = '''
+SELECT max(id) AS id, site, day FROM snapshots
+WHERE day BETWEEN :start AND :end AND (:site IS NULL OR site = :site)
+  AND id IN (SELECT snapshot FROM sections WHERE section = :section)
+GROUP BY day, site
+'''
+
+
+class Archive:
+
+    def __init__(self, path: Path = None, batch_size: int = BATCH_SIZE):
+        self.path = Path(path or ARCHIVE_PATH)
+        self.batch_size = batch_size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = self._connect()
+        db.executescript(SCHEMA)
+        db.close()
+
+        self._queue = queue.Queue()
+        self._writer: threading.Thread = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+
+        # readers don't block the writer, or the writer readers
+        db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def append(self, site: str, day: date, data: dict, topics: list[str],
+               sections: tuple[str, ...] = SECTIONS):
+        '''
+        Queue a day's data, in the form MeetingDocumentGenerator takes, and
+        its safety topics to be written in the background
+        site: the site's name, None for the only site
+        sections: the parts of data to keep, leave out any whose upstream
+                  couldn't be fetched so they don't hide earlier snapshots
+        '''
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write,
+                                                name='archive', daemon=True)
+                self._writer.start()
+        self._queue.put((site or '', day, datetime.now(), data, topics,
+                         sections))
+
+    def flush(self):
+        '''wait until everything appended has been written'''
+        self._queue.join()
+
+    def _write(self):
+        db = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with db:
+                    for snapshot in batch:
+                        _insert(db, *snapshot)
+            except Exception as error:
+                # losing a snapshot shouldn't stop documents being written
+                print(f'ERROR: Unable to archive {len(batch)} days ({error!r})')
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def query(self, sql: str, **params) -> list[tuple]:
+        '''
+        Run sql, where {latest} selects the id, site and day of the latest
+        snapshots with :section from :start to :end for :site, or every site
+        when None
+        '''
+        params = {'site': None, **params}
+        for name in ('start', 'end'):
+            if isinstance(params.get(name), date):
+                params[name] = params[name].isoformat()
+        db = self._connect()
+        try:
+            return db.execute(sql.format(latest=LATEST), params).fetchall()
+        finally:
+            db.close()
+
+    def tide_summary(self, start: date, end: date, site: str = None) -> list:
+        '''(day, site, lowest, highest) hourly tide of each day'''
+        return _days(self.query('''
+            SELECT latest.day, latest.site, min(meters), max(meters)
+            FROM ({latest}) AS latest JOIN tides ON tides.snapshot = latest.id
+            WHERE kind = 'hourly'
+            GROUP BY latest.day, latest.site ORDER BY latest.day, latest.site
+            ''', section='tides', start=start, end=end, site=site))
+
+    def weather_summary(self, start: date, end: date, site: str = None) -> list:
+        '''(day, site, lowest temp, highest temp, highest uv) of each day'''
+        return _days(self.query('''
+            SELECT latest.day, latest.site, min(temp), max(temp), max(uv)
+            FROM ({latest}) AS latest JOIN weather ON weather.snapshot = latest.id
+            GROUP BY latest.day, latest.site ORDER BY latest.day, latest.site
+            ''', section='weather', start=start, end=end, site=site))
+
+    def booking_counts(self, start: date, end: date, site: str = None) -> list:
+        '''(day, site, number of bookings) of each day'''
+        return _days(self.query('''
+            SELECT latest.day, latest.site, count(bookings.snapshot)
+            FROM ({latest}) AS latest
+            LEFT JOIN bookings ON bookings.snapshot = latest.id
+            GROUP BY latest.day, latest.site ORDER BY latest.day, latest.site
+            ''', section='bookings', start=start, end=end, site=site))
+
+    def topic_days(self, text: str, start: date, end: date,
+                   site: str = None) -> list[date]:
+        '''days with a safety topic containing text'''
+        return [day for day, in _days(self.query('''
+            SELECT DISTINCT latest.day
+            FROM ({latest}) AS latest
+            JOIN safety_topics ON safety_topics.snapshot = latest.id
+            WHERE instr(topic, :text) ORDER BY latest.day
+            ''', section='safety topics', start=start, end=end, site=site,
+            text=text))]
+
+    def low_tide_days(self, meters: float, start: date, end: date,
+                      site: str = None, first_hour: int = 9,
+                      last_hour: int = 16) -> list[date]:
+        '''
+        days with an hourly tide at or below meters between first_hour and
+        last_hour, by default Tide.is_within_operational_hours
+        '''
+        return [day for day, in _days(self.query('''
+            SELECT DISTINCT latest.day
+            FROM ({latest}) AS latest JOIN tides ON tides.snapshot = latest.id
+            WHERE kind = 'hourly' AND meters <= :meters
+              AND CAST(strftime('%H', time) AS INTEGER)
+                  BETWEEN :first_hour AND :last_hour
+            ORDER BY latest.day
+            ''', section='tides', start=start, end=end, site=site,
+            meters=meters, first_hour=first_hour, last_hour=last_hour))]
+
+
+_archives: dict[Path, Archive] = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(path: str = None) -> Archive:
+    '''the archive at path, or ARCHIVE_PATH, shared within the process'''
+    path = Path(path or ARCHIVE_PATH).absolute()
+    with _archives_lock:
+        if path not in _archives:
+            _archives[path] = Archive(path)
+        return _archives[path]
+
+
+def _insert(db: sqlite3.Connection, site: str, day: date,
+            archived_at: datetime, data: dict, topics: list[str],
+            sections: tuple[str, ...]):
+    if not sections:
+        return
+    snapshot = db.execute(
+        'INSERT INTO snapshots (site, day, archived_at) VALUES (?, ?, ?)',
+        (site, day.isoformat(), archived_at.isoformat())).lastrowid
+    db.executemany('INSERT INTO sections VALUES (?, ?)',
+        [(snapshot, section) for section in sections])
+    if 'tides' in sections:
+        db.executemany('INSERT INTO tides VALUES (?, ?, ?, ?)',
+            [(snapshot, kind, tide.time.isoformat(), tide.meters)
+             for kind in ('high and low', 'hourly')
+             for tide in data['tides'][kind]])
+    if 'weather' in sections:
+        db.executemany('INSERT INTO weather VALUES (?, ?, ?, ?, ?, ?)',
+            [(snapshot, hour.date.isoformat(), hour.description, hour.temp,
+              hour.wind, hour.uv) for hour in data['weather']])
+    if 'bookings' in sections:
+        db.executemany('INSERT INTO bookings VALUES (?, ?, ?, ?, ?)',
+            [(snapshot, booking.title, booking.all_day,
+              booking.start_at.isoformat(), booking.end_at.isoformat())
+             for booking in data['bookings']])
+    if 'safety topics' in sections:
+        db.executemany('INSERT INTO safety_topics VALUES (?, ?)',
+            [(snapshot, topic) for topic in topics])
+
+
+def _days(rows: list[tuple]) -> list[tuple]:
+    '''rows with their first column as a date'''
+    return [(date.fromisoformat(row[0]), *row[1:]) for row in rows]
@@ -0,0 +1,47 @@
+"""
+replacing files whole
+
+readers of the response cache, the manifest, a recording, the Prometheus
+textfile or a meeting document must never find it half written. Each is
+written to a temporary file in the same directory, flushed to disk, and
+renamed over the old one, which is atomic, or removed if writing fails.
+
+    with atomic_write(path, 'w') as f:
+        json.dump(data, f)
+"""
+
+from contextlib import contextmanager
+from typing import IO
+import os
+import secrets
+
+
+@contextmanager
+def atomic_write(path: str | os.PathLike, mode: str = 'wb',
+                 permissions: int = None) -> IO:
+    '''
+    A file open in mode, 'wb' or 'w', which replaces path once the block
+    finishes, or is removed if it raises
+    permissions: mode bits for the new file, by default those open() gives
+                 a new file under the umask
+    '''
+    directory, name = os.path.split(os.fspath(path))
+    tmp = os.path.join(directory, f'.{name}.{secrets.token_hex(8)}.tmp')
+
+    # created like open() would, so the kernel applies the umask, where
+    # mkstemp's files are always 0600
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                 getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            if permissions is not None:
+                os.fchmod(f.fileno(), permissions)
+
+            # on disk before the rename, or a power cut can leave it empty
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
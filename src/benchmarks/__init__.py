@@ -0,0 +1,7 @@
+"""
+benchmarks for the morning meeting generator
+
+run from the project's src directory, e.g.
+
+    python -m benchmarks.fetch
+"""
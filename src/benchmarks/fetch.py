@@ -0,0 +1,96 @@
+"""
+sequential vs concurrent fetch stage
+
+serves the recorded payloads from local stub servers with an artificial
+round trip delay and compares calling get_tides, get_api_weather and
+get_bookings one after another against fetch.fetch_all.
+
+    python -m benchmarks.fetch [--repeat N]
+"""
+
+import argparse
+import tempfile
+import time
+
+import cache
+import config
+import Booking
+import Tide
+import Weather
+from benchmarks import stubs
+from fetch import fetch_all
+import mmg
+
+
+# artificial upstream latency in seconds
+DELAYS = {'tides': 0.6, 'weather': 0.3, 'bookings': 0.4}
+
+
+def sequential():
+    Tide.get_tides()
+    Weather.get_api_weather(10, 18, config.CONFIG.api_key)
+    Booking.get_bookings(config.CONFIG.calendar_id)
+
+
+def concurrent():
+    fetch_all(mmg.upstream_sources())
+
+
+def best_of(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    config.CONFIG = config.Config({
+        'api key': 'benchmark',
+        'calendar ID': 'benchmark',
+        'personal access token': 'benchmark',
+        'employees': [],
+        'output location': '',
+    })
+    ttl = cache.TTL
+    cache.TTL = dict.fromkeys(ttl, 0)
+    cache.cache = cache.ResponseCache(tempfile.mkdtemp())
+
+    with stubs.tides_server(DELAYS['tides']) as tides, \
+            stubs.weather_server(DELAYS['weather']) as weather, \
+            stubs.timetree_server(DELAYS['bookings']) as timetree:
+        Tide.URL = tides.url + '/{station}'
+        Weather.URL = weather.url
+        Booking.BASE_URL = timetree.url
+
+        seq = best_of(sequential, args.repeat)
+        conc = best_of(concurrent, args.repeat)
+        print(f'upstream delays: {DELAYS}')
+        print(f'sequential: {seq:.3f}s')
+        print(f'concurrent: {conc:.3f}s  ({seq / conc:.2f}x)')
+
+        cache.TTL = ttl
+        fetch_all(mmg.upstream_sources())
+        print(f'response cache warm: '
+              f'{best_of(concurrent, args.repeat):.3f}s')
+        cache.TTL = dict.fromkeys(ttl, 0)
+
+        # a hung upstream only costs its own timeout
+        weather.delay = 3
+        mmg.FETCH_TIMEOUTS['weather'] = 1
+        start = time.perf_counter()
+        data = fetch_all(mmg.upstream_sources())
+        print(f'weather stalled for {weather.delay}s, timeout '
+              f'{mmg.FETCH_TIMEOUTS["weather"]}s: '
+              f'{time.perf_counter() - start:.3f}s, '
+              f'{len(data["tides:7460"])} days of tides, '
+              f'{len(data["bookings:benchmark"])} days of bookings')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+columnar hourly series vs lists of Tide and Weather dataclasses
+
+compares the memory held and the time taken to build a week of hourly tides
+and weather for a number of sites, and the time to turn them into the rule
+engine's arrays.
+
+    python -m benchmarks.hourly [--sites N] [--days N]
+"""
+
+import argparse
+from datetime import date, timedelta
+import json
+import time
+import tracemalloc
+
+import fixtures
+from Weather import parse_api_hour
+import hourly
+import rules
+import Tide
+import timestamps
+
+
+def parsed_tides(rows, days):
+    '''a list of Tide dataclasses for each day, as parse_hourly_tides was'''
+    result = []
+    for day, row in zip(days, rows):
+        midnight = timestamps.midnight(day)
+        tides = []
+        for i, raw in enumerate(row[1:25]):
+            meters = float(raw) if raw else None
+            feet = '%.1f' % (meters * 3.2808) if raw else None
+            tides.append(Tide.Tide(midnight.replace(hour=i), meters, feet))
+        result.append(tides)
+    return result
+
+
+def build(kind, rows, forecast, days):
+    if kind == 'dataclasses':
+        return (parsed_tides(rows, days),
+                [[parse_api_hour(hour) for hour in forecast_day['hour']]
+                 for forecast_day in forecast])
+    return ([Tide.parse_hourly_tides(rows, day) for day in days],
+            [hourly.WeatherSeries.from_api_hours(forecast_day['hour'])
+             for forecast_day in forecast])
+
+
+def measure(kind, rows, forecast, days, sites):
+    start = time.perf_counter()
+    for _ in range(sites):
+        build(kind, rows, forecast, days)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    held = [build(kind, rows, forecast, days) for _ in range(sites)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for tides, weather in held:
+        for day_tides, day_weather in zip(tides, weather):
+            rules.day_series(day_weather, day_tides)
+    return size, seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sites', type=int, default=50)
+    parser.add_argument('--days', type=int, default=3)
+    args = parser.parse_args()
+
+    first = date.today()
+    page = fixtures.load('tides_7460.html', first)
+    rows = Tide.parse_tide_page([page], [Tide.HOURLY_TABLE_ID])[
+        Tide.HOURLY_TABLE_ID]
+    forecast = json.loads(fixtures.load('weather_forecast.json', first))[
+        'forecast']['forecastday'][:args.days]
+    days = [first + timedelta(days=i) for i in range(len(forecast))]
+
+    hours = args.sites * len(days) * 48
+    print(f'{args.sites} sites x {len(days)} days, {hours} hours of tides '
+          'and weather\n')
+    print(f'{"":<14}{"memory":>12}{"build":>12}{"rule arrays":>14}')
+    for kind in ('dataclasses', 'series'):
+        size, seconds, arrays = measure(kind, rows, forecast, days,
+                                        args.sites)
+        print(f'{kind:<14}{size / 1024:>10.0f}KB{seconds * 1000:>10.1f}ms'
+              f'{arrays * 1000:>12.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
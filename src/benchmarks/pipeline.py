@@ -0,0 +1,223 @@
+"""
+end to end timing of the meeting document pipeline, stage by stage
+
+runs the pipeline against the recorded payloads served from local stub
+servers and reports the wall time, CPU time and peak memory of each stage
+
+    fetch           download the tide page, forecast and bookings through
+                    the response cache, as fetch_tide_page, fetch_forecast
+                    and fetch_upcoming_events do in a run
+    parse           parse_tide_range, parse_forecast and
+                    parse_upcoming_events on the responses
+    safety topics   MeetingDocumentGenerator, which evaluates the topics
+    render          fill the document template
+    save            write the .docx to disk
+
+times are the median over --repeat runs, peak memory is measured in a
+separate run under tracemalloc so it doesn't slow the timed runs. Results
+can be written as JSON, and compared against a baseline file, in which
+case any stage slower than the baseline by more than --tolerance is
+reported and the exit status is 1.
+
+    python -m benchmarks.pipeline [--repeat N] [--json out.json]
+        [--baseline benchmarks/baseline.json] [--save-baseline]
+"""
+
+from datetime import date
+from pathlib import Path
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import Booking
+import Tide
+import Weather
+from benchmarks import stubs
+from mmg import MeetingDocumentGenerator
+from sites import Site
+import cache
+import config
+import fixtures
+
+
+STAGES = ('fetch', 'parse', 'safety topics', 'render', 'save')
+BASELINE = Path(__file__).absolute().parent / 'baseline.json'
+
+# wall time must grow by more than this fraction, and by more than
+# MIN_SLOWDOWN seconds, to count as a regression
+TOLERANCE = 0.25
+MIN_SLOWDOWN = 0.002
+
+
+class Stages:
+    '''times each stage of a single run, and optionally its peak memory'''
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.results = {}
+
+    def run(self, name: str, func, *args):
+        if self.memory:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = func(*args)
+        self.results[name] = {
+            'wall': time.perf_counter() - wall,
+            'cpu': time.process_time() - cpu,
+        }
+        if self.memory:
+            self.results[name]['peak memory'] = \
+                tracemalloc.get_traced_memory()[1]
+        return result
+
+
+def fetch(site: Site, day: date) -> dict:
+    return {
+        'tides': Tide.fetch_tide_page(station=site.station),
+        'weather': Weather.fetch_forecast(config.CONFIG.api_key, day, 1,
+                                          location=site.location),
+        'bookings': Booking.fetch_upcoming_events(site.calendar_id, day, 1),
+    }
+
+
+def parse(responses: dict, site: Site, day: date) -> dict:
+    return {
+        'tides': Tide.parse_tide_range(responses['tides'], day, 1)[day],
+        'weather': Weather.parse_forecast(responses['weather'])
+            .window(day, *site.forecast_hours),
+        'bookings': Booking.parse_upcoming_events(responses['bookings'],
+                                                  day, 1)[day],
+    }
+
+
+def run_once(site: Site, memory: bool = False) -> dict:
+    day = date.today()
+    stages = Stages(memory)
+    responses = stages.run('fetch', fetch, site, day)
+    data = stages.run('parse', parse, responses, site, day)
+    meeting_doc = stages.run('safety topics', MeetingDocumentGenerator,
+                             day, data, site)
+    stages.run('render', meeting_doc.generate_from_template)
+    stages.run('save', meeting_doc.write_to_file)
+    return stages.results
+
+
+@contextlib.contextmanager
+def upstreams(delay: float, directory: str):
+    '''
+    point the fetchers at stub servers, with a response cache in directory
+    which every request goes through to the stubs
+    '''
+    saved = (config.CONFIG, cache.cache, cache.TTL, Tide.URL, Weather.URL,
+             Booking.BASE_URL)
+    config.CONFIG = fixtures.load_config({'api key': 'benchmark',
+                                          'personal access token': 'benchmark'})
+    cache.cache = cache.ResponseCache(directory)
+    cache.TTL = dict.fromkeys(cache.TTL, 0)
+    try:
+        with stubs.tides_server(delay) as tides, \
+                stubs.weather_server(delay) as weather, \
+                stubs.timetree_server(delay) as timetree:
+            Tide.URL = tides.url + '/{station}'
+            Weather.URL = weather.url
+            Booking.BASE_URL = timetree.url
+            yield
+    finally:
+        (config.CONFIG, cache.cache, cache.TTL, Tide.URL, Weather.URL,
+         Booking.BASE_URL) = saved
+
+
+def benchmark(repeat: int, delay: float = 0) -> dict:
+    output = tempfile.TemporaryDirectory()
+    site = Site(None, 'ladysmith', '7460', 'benchmark', output.name + '/',
+                ('Employee 1', 'Employee 2', 'Employee 3'))
+    with output, upstreams(delay, output.name + '/cache'):
+
+        # the first run loads the template and icons, which happens once
+        # per process
+        run_once(site)
+        runs = [run_once(site) for _ in range(repeat)]
+
+        tracemalloc.start()
+        try:
+            peaks = run_once(site, memory=True)
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'stages': {
+            stage: {
+                'wall': statistics.median(run[stage]['wall'] for run in runs),
+                'cpu': statistics.median(run[stage]['cpu'] for run in runs),
+                'peak memory': peaks[stage]['peak memory'],
+            }
+            for stage in STAGES
+        },
+    }
+
+
+def regressions(results: dict, baseline: dict,
+                tolerance: float = TOLERANCE) -> list[str]:
+    '''stages whose wall time grew by more than tolerance over the baseline'''
+    slower = []
+    for stage, result in results['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before and result['wall'] > before['wall'] * (1 + tolerance) \
+                and result['wall'] - before['wall'] > MIN_SLOWDOWN:
+            slower.append(f'{stage}: {result["wall"] * 1000:.1f}ms, baseline '
+                          f'{before["wall"] * 1000:.1f}ms')
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0,
+                        help='artificial upstream latency in seconds')
+    parser.add_argument('--json', metavar='PATH',
+                        help='write the results to PATH, - for stdout')
+    parser.add_argument('--baseline', metavar='PATH', type=Path,
+                        default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    # write_to_file reports every document it saves
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = benchmark(args.repeat, args.delay)
+
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    else:
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f'{"stage":<16}{"wall":>10}{"cpu":>10}{"peak memory":>14}')
+        for stage, result in results['stages'].items():
+            print(f'{stage:<16}{result["wall"] * 1000:>8.1f}ms'
+                  f'{result["cpu"] * 1000:>8.1f}ms'
+                  f'{result["peak memory"] / 1024:>12.0f}KB')
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + '\n')
+    elif args.baseline.exists():
+        slower = regressions(results, json.loads(args.baseline.read_text()),
+                             args.tolerance)
+        for line in slower:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+building each document from scratch vs filling the prebuilt template
+
+renders the recorded day with MeetingDocumentGenerator.generate and
+generate_from_template, saving each document to memory, and reports
+documents per second. Then saves one document at each zip compression
+level and reports saves per second and the document's size.
+
+    python -m benchmarks.render [--docs N]
+"""
+
+import argparse
+from datetime import date
+import io
+import time
+
+import config
+import fixtures
+from mmg import MeetingDocumentGenerator
+import output
+from sites import Site
+
+
+SITE = Site(None, 'ladysmith', '7460', 'benchmark', '',
+            ('Employee 1', 'Employee 2', 'Employee 3'))
+
+
+def docs_per_second(method: str, data: dict, docs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(docs):
+        meeting_doc = MeetingDocumentGenerator(date.today(), data, SITE)
+        getattr(meeting_doc, method)()
+        meeting_doc.document.save(io.BytesIO())
+    return docs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--docs', type=int, default=50)
+    args = parser.parse_args()
+
+    config.CONFIG = fixtures.load_config()
+    data = fixtures.meeting_data()
+
+    # the template is loaded once per process, keep that out of the timing
+    docs_per_second('generate_from_template', data, 1)
+    for method in ('generate', 'generate_from_template'):
+        print(f'{method:<24}{docs_per_second(method, data, args.docs):>8.1f} docs/s')
+
+    meeting_doc = MeetingDocumentGenerator(date.today(), data, SITE)
+    meeting_doc.generate_from_template()
+    for level in (0, 1, output.COMPRESSION_LEVEL, 9):
+        start = time.perf_counter()
+        for _ in range(args.docs):
+            buffer = io.BytesIO()
+            output.save(meeting_doc.document, buffer, level)
+        rate = args.docs / (time.perf_counter() - start)
+        print(f'compression level {level:<6}{rate:>8.1f} saves/s '
+              f'{len(buffer.getvalue()) / 1024:>8.0f}KB')
+
+
+if __name__ == '__main__':
+    main()
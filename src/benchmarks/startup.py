@@ -0,0 +1,75 @@
+"""
+start up time of the command line entry points
+
+runs each command under python -X importtime and reports its wall time,
+the time spent importing and the slowest top level imports. Commands which
+only read config.json shouldn't import requests, NumPy or python-docx.
+
+    python -m benchmarks.startup [--repeat N] [--top N]
+"""
+
+from pathlib import Path
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+
+SRC_DIR = Path(__file__).absolute().parent.parent
+
+COMMANDS = {
+    'main.py --help': ['main.py', '--help'],
+    'main.py validate-config': ['main.py', 'validate-config'],
+    'import mmg': ['-c', 'import mmg'],
+}
+
+HEAVY = ('requests', 'numpy', 'docx', 'dateparser', 'bs4')
+
+# import time:       self [us] |     cumulative | imported package
+IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def importtime(args: list[str]) -> tuple[float, list[tuple[int, int, str]]]:
+    '''
+    Run python -X importtime with args
+    Returns the wall time and (self us, cumulative us, depth, module) of
+    every import
+    '''
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args],
+                            cwd=SRC_DIR, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    imports = [(int(own), int(cumulative), len(indent) // 2, module)
+               for own, cumulative, indent, module
+               in IMPORT_TIME.findall(result.stderr)]
+    return wall, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, command in COMMANDS.items():
+        runs = [importtime(command) for _ in range(args.repeat)]
+        wall, imports = min(runs, key=lambda run: run[0])
+        total = sum(own for own, _, _, _ in imports)
+        heavy = sorted({module.split('.')[0] for _, _, _, module in imports
+                        if module.split('.')[0] in HEAVY})
+        print(f'{name}: {wall * 1000:.0f}ms, {total / 1000:.0f}ms importing '
+              f'{len(imports)} modules')
+        print(f'  heavy modules: {", ".join(heavy) or "none"}')
+
+        # the site module is imported by every interpreter
+        top = sorted((imp for imp in imports
+                      if imp[2] <= 1 and imp[3] != 'site'),
+                     key=lambda imp: imp[1], reverse=True)[:args.top]
+        for _, cumulative, _, module in top:
+            print(f'  {cumulative / 1000:>8.1f}ms  {module}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+local stand ins for tides.gc.ca, WeatherAPI and TimeTree
+
+each StubServer serves a single fixture payload on localhost after an
+artificial delay, which lets the benchmarks measure network bound stages
+without touching the real upstreams.
+"""
+
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import fixtures
+
+
+class StubServer:
+
+    def __init__(self, payload: bytes, content_type: str, delay: float = 0,
+                 etag: str = None, errors: int = 0):
+        self.payload = payload
+        self.content_type = content_type
+        self.delay = delay
+        self.etag = etag
+
+        # number of upcoming requests to answer with a 503
+        self.errors = errors
+        self.requests = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                if stub.errors:
+                    stub.errors -= 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if stub.etag and self.headers['If-None-Match'] == stub.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if stub.etag:
+                    self.send_header('ETag', stub.etag)
+                self.send_header('Content-Type', stub.content_type)
+                self.send_header('Content-Length', str(len(stub.payload)))
+                self.end_headers()
+                self.wfile.write(stub.payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def tides_server(delay: float = 0, day: date = None) -> StubServer:
+    return StubServer(fixtures.load('tides_7460.html', day or date.today()),
+                      'text/html; charset=utf-8', delay)
+
+
+def weather_server(delay: float = 0, day: date = None) -> StubServer:
+    return StubServer(fixtures.load('weather_forecast.json', day or date.today()),
+                      'application/json', delay)
+
+
+def timetree_server(delay: float = 0, day: date = None) -> StubServer:
+    return StubServer(
+        fixtures.load('timetree_upcoming_events.json', day or date.today()),
+        'application/vnd.timetree.v1+json', delay)
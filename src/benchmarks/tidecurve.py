@@ -0,0 +1,58 @@
+"""
+closure windows for a season of tides
+
+builds a TideCurve through a synthetic season of semidiurnal highs and lows,
+a high or low every 6 hours 12 minutes, and times building the minute
+resolution curve and finding every stretch at or below 0.6m.
+
+    python -m benchmarks.tidecurve [--days N] [--repeat N]
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import time
+
+from Tide import Tide
+from tidecurve import TideCurve
+
+
+# half a semidiurnal tide
+HALF_CYCLE = timedelta(hours=6, minutes=12)
+
+
+def season(days: int) -> list[Tide]:
+    '''alternating highs and lows, the range changing over two weeks'''
+    start = datetime(2023, 5, 1, 2, 40)
+    tides = []
+    for i in range(int(days * timedelta(days=1) / HALF_CYCLE)):
+        spring = 1 + 0.5 * ((i % 54) / 27 - 1) ** 2
+        meters = 2.2 + (1.9 if i % 2 else -1.9) * spring
+        tides.append(Tide(start + i * HALF_CYCLE, round(meters, 1), None))
+    return tides
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--days', type=int, default=183)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tides = season(args.days)
+    build, search = [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        curve = TideCurve(tides)
+        build.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        windows = curve.windows(0.6, hours=(9, 16))
+        search.append(time.perf_counter() - start)
+
+    print(f'{len(tides)} highs and lows over {args.days} days, '
+          f'{len(curve.heights)} minutes')
+    print(f'build curve    {min(build) * 1000:>8.2f}ms')
+    print(f'find windows   {min(search) * 1000:>8.2f}ms  '
+          f'{len(windows)} windows within operating hours')
+
+
+if __name__ == '__main__':
+    main()
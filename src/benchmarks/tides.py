@@ -0,0 +1,61 @@
+"""
+streaming tide page parser vs a full BeautifulSoup tree
+
+parses the recorded station page both ways and reports time per page and
+peak memory allocated while parsing.
+
+    python -m benchmarks.tides [--repeat N]
+"""
+
+import argparse
+from datetime import date
+import timeit
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import fixtures
+import Tide
+
+
+def soup_path(content: bytes, day_table_id: str):
+    '''the original get_tides parse'''
+    soup = BeautifulSoup(content, 'html.parser')
+    rows = soup.find(id=day_table_id).tbody.find_all('tr')
+    hourly = soup.find(id=Tide.HOURLY_TABLE_ID).tbody.find('tr').find_all('td')
+    return rows, hourly
+
+
+def streaming_path(content: bytes, day_table_id: str):
+    chunks = (content[i:i + Tide.CHUNK_SIZE]
+              for i in range(0, len(content), Tide.CHUNK_SIZE))
+    return Tide.parse_tide_page(chunks, [day_table_id, Tide.HOURLY_TABLE_ID])
+
+
+def peak_memory(func, *args) -> int:
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    content = fixtures.load('tides_7460.html', date.today())
+    day_table_id = date.today().strftime('day-table-%Y-%m-%d')
+    print(f'station page: {len(content) / 1024:.0f} KiB')
+    for name, func in (('BeautifulSoup', soup_path),
+                       ('streaming', streaming_path)):
+        seconds = timeit.timeit(lambda: func(content, day_table_id),
+                                number=args.repeat) / args.repeat
+        peak = peak_memory(func, content, day_table_id)
+        print(f'{name:<14}{seconds * 1000:>8.2f}ms/page'
+              f'{peak / 1024:>10.0f} KiB peak')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+timestamps module vs dateparser
+
+compares the per record cost of parsing each upstream's timestamp format,
+and the time to start an interpreter and import the fetch modules with and
+without dateparser being imported eagerly.
+
+    python -m benchmarks.timestamps [--records N]
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+import timeit
+
+import dateparser
+
+import timestamps
+
+
+SAMPLES = [
+    ('tide table', '03:43', timestamps.parse_clock),
+    ('hourly tides', 'midnight today', lambda text: timestamps.midnight()),
+    ('WeatherAPI', '2023-06-14 10:00', timestamps.parse_iso),
+    ('TimeTree', '2023-06-14T16:00:00.000Z', timestamps.parse_iso),
+]
+
+STARTUP = {
+    'before': 'import dateparser, Tide, Weather, Booking',
+    'after': 'import Tide, Weather, Booking',
+}
+
+
+def startup(statement: str, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--records', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f'{"format":<14}{"dateparser":>14}{"timestamps":>14}{"speedup":>10}')
+    for name, text, fast in SAMPLES:
+        slow = timeit.timeit(lambda: dateparser.parse(text),
+                             number=args.records) / args.records
+        quick = timeit.timeit(lambda: fast(text),
+                              number=args.records) / args.records
+        print(f'{name:<14}{slow * 1e6:>12.1f}us{quick * 1e6:>12.2f}us'
+              f'{slow / quick:>9.0f}x')
+
+    print()
+    for name, statement in STARTUP.items():
+        print(f'startup {name}: {startup(statement) * 1000:.0f}ms  ({statement})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+persistent response cache for the upstream fetches
+
+responses are stored on disk keyed by url, params, request headers and the
+date, so regenerating a document or running several generators in the same
+morning doesn't download everything again. Each source has its own time to
+live, once an entry expires it is revalidated with If-None-Match or
+If-Modified-Since, and the least recently used entries are evicted when the
+cache grows past MAX_BYTES.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from atomic import atomic_write
+import metrics
+import replay
+import upstream
+
+
+CACHE_DIR = Path(__file__).absolute().parent.parent / '.cache' / 'responses'
+MAX_BYTES = 50 * 1024 * 1024
+
+# seconds before a cached response has to be revalidated
+TTL = {
+    # predictions for a day never change, and the date is part of the key
+    'tides': 24 * 60 * 60,
+    'weather': 60 * 60,
+    # bookings change during the morning, but revalidation is cheap
+    'bookings': 60,
+}
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    content: bytes
+    headers: dict = field(default_factory=dict)
+    from_cache: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size: int = 1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+
+class ResponseCache:
+
+    def __init__(self, directory: Path = CACHE_DIR, max_bytes: int = MAX_BYTES,
+                 client: upstream.Client = None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+        # the shared client, so connections are kept alive and reused across
+        # sources and sites
+        self.client = client or upstream.client
+        self._lock = threading.Lock()
+
+    def get(self, url: str, params: dict = None, headers: dict = None,
+            ttl: float = 0, timeout: float = None) -> CachedResponse:
+        '''
+        Return the response for a GET request, from disk if the cached copy
+        is younger than ttl seconds or the server says it's not modified
+        '''
+        key = self.key(url, params, headers)
+        entry = self._read(key)
+        if entry and time.time() - entry[0]['stored_at'] < ttl:
+            self._touch(key)
+            return CachedResponse(entry[0]['status_code'], entry[1],
+                                  entry[0]['headers'], from_cache=True)
+
+        request_headers = dict(headers or {})
+        if entry:
+            if 'etag' in entry[0]['headers']:
+                request_headers['If-None-Match'] = entry[0]['headers']['etag']
+            if 'last-modified' in entry[0]['headers']:
+                request_headers['If-Modified-Since'] = \
+                    entry[0]['headers']['last-modified']
+
+        try:
+            res = self.client.get(url, params=params,
+                                  headers=request_headers, timeout=timeout)
+        except requests.RequestException:
+            # a stale response is better than no meeting document
+            if entry:
+                return CachedResponse(entry[0]['status_code'], entry[1],
+                                      entry[0]['headers'], from_cache=True)
+            raise
+
+        if res.status_code == 304 and entry:
+            self._write(key, entry[0], entry[1])
+            return CachedResponse(entry[0]['status_code'], entry[1],
+                                  entry[0]['headers'], from_cache=True)
+
+        response = CachedResponse(res.status_code, res.content, {
+            name.lower(): value for name, value in res.headers.items()
+            if name.lower() in ('etag', 'last-modified', 'content-type')
+        })
+        if res.ok:
+            self._write(key, {'url': url,
+                              'status_code': response.status_code,
+                              'headers': response.headers}, response.content)
+        return response
+
+    def key(self, url: str, params: dict = None, headers: dict = None) -> str:
+        raw = json.dumps([url, sorted((params or {}).items()),
+                          sorted((headers or {}).items()),
+                          date.today().isoformat()])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def clear(self):
+        for path in self.directory.glob('*'):
+            path.unlink(missing_ok=True)
+
+    def _read(self, key: str):
+        try:
+            meta = json.loads((self.directory / f'{key}.json').read_text())
+            body = (self.directory / f'{key}.body').read_bytes()
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return meta, body
+
+    def _touch(self, key: str):
+        '''mark an entry as recently used'''
+        try:
+            os.utime(self.directory / f'{key}.body')
+        except FileNotFoundError:
+            pass
+
+    def _write(self, key: str, meta: dict, body: bytes):
+        meta = dict(meta, stored_at=time.time())
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # body first, so a reader never finds metadata without its body
+        with atomic_write(self.directory / f'{key}.body') as f:
+            f.write(body)
+        with atomic_write(self.directory / f'{key}.json', 'w') as f:
+            json.dump(meta, f)
+        self._evict()
+
+    def _evict(self):
+        '''remove least recently used entries until under max_bytes'''
+        with self._lock:
+            bodies = []
+            for path in self.directory.glob('*.body'):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                bodies.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in bodies)
+            for _, size, path in sorted(bodies):
+                if total <= self.max_bytes:
+                    break
+                path.with_suffix('.json').unlink(missing_ok=True)
+                path.unlink(missing_ok=True)
+                total -= size
+
+
+cache = ResponseCache()
+
+
+def get(source: str, url: str, params: dict = None, headers: dict = None,
+        timeout: float = None) -> CachedResponse:
+    '''
+    GET url through the shared cache using source's time to live, or from
+    the recording being replayed
+    '''
+    with metrics.span('upstream', source=source, url=url) as attributes:
+        recorder = replay.recorder
+        if recorder is not None and recorder.mode == 'replay':
+            response = recorder.load(source, url, params)
+        else:
+            response = cache.get(url, params, headers, TTL[source], timeout)
+            if recorder is not None and response.ok:
+                recorder.save(source, url, params, response)
+        attributes.update({
+            'status code': response.status_code,
+            'bytes': len(response.content),
+            'cache hit': response.from_cache,
+        })
+        return response
@@ -1,22 +1,201 @@
 """
 load configuration file for morning meeting generator
-config properties will be available as a global dictionary after load() is run
+config properties will be available as CONFIG after load() is run
+
+CONFIG is checked against the schema below as soon as it's read, before
+anything is fetched, and can't be changed. Properties are read as typed
+attributes, e.g. CONFIG.api_key for "api key", or by their key in
+config.json. Long running processes call reload() to pick up changes to the
+file.
 """
 
 
+from collections.abc import Mapping
+from datetime import time
+from pathlib import Path
+from string import Formatter
+from types import MappingProxyType
 import json
 import sys
-import requests
-from pathlib import Path
+
+
+CONFIG_PATH = Path(__file__).absolute().parent.parent / 'config.json'
+
+# properties every config needs, and their types
+REQUIRED = {
+    'employees': list,
+    'personal access token': str,
+    'calendar ID': str,
+    'output location': str,
+    'api key': str,
+}
+
+# properties a config may have, and their types
+OPTIONAL = {
+    'sites': list,
+    'template': str,
+    'archive': str,
+    'compression level': int,
+    'metrics': dict,
+    'daemon': dict,
+    'safety rules': list,
+}
+
+# properties each site may set for itself
+SITE_OPTIONAL = {
+    'name': str,
+    'location': str,
+    'tide station': (str, int),
+    'forecast hours': list,
+}
+
+# what a safety rule may compare and report, shared with rules.py, which
+# can't be imported to check a config since it needs NumPy
+RULE_SERIES = ('temp', 'uv', 'wind', 'tide')
+RULE_OPS = ('<', '<=', '>', '>=', '==')
+RULE_REPORTS = ('any', 'span', 'runs', 'windows')
+
+# keys of each safety rule, and their types
+RULE_REQUIRED = {
+    'series': str,
+    'op': str,
+    'value': (int, float),
+    'message': str,
+}
+RULE_OPTIONAL = {
+    'report': str,
+    'hours': list,
+}
+
+# properties of "metrics", and their types
+METRICS_OPTIONAL = {
+    'log': str,
+    'prometheus': str,
+}
+
+# upstreams the daemon refreshes in the background
+REFRESHED = ('tides', 'weather')
+
+
+class ConfigError(ValueError):
+
+    def __init__(self, problems: list[str]):
+        super().__init__('\n'.join(problems))
+        self.problems = problems
+
+
+class Config(Mapping):
+    '''a validated config, which can't be changed once created'''
+
+    __slots__ = ('_raw',)
+
+    def __init__(self, raw: dict):
+        problems = validate(raw)
+        if problems:
+            raise ConfigError(problems)
+        object.__setattr__(self, '_raw', _freeze(raw))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('the config is read only')
+
+    def __getitem__(self, key: str):
+        return self._raw[key]
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __repr__(self):
+        return f'Config({self.to_dict()!r})'
+
+    def __reduce__(self):
+        # mapping proxies can't be pickled, render workers get a copy
+        return Config, (self.to_dict(),)
+
+    def to_dict(self) -> dict:
+        return _thaw(self._raw)
+
+    @property
+    def employees(self) -> tuple[str, ...]:
+        return self._raw['employees']
+
+    @property
+    def personal_access_token(self) -> str:
+        return self._raw['personal access token']
+
+    @property
+    def calendar_id(self) -> str:
+        return self._raw['calendar ID']
+
+    @property
+    def output_location(self) -> str:
+        return self._raw['output location']
+
+    @property
+    def api_key(self) -> str:
+        return self._raw['api key']
+
+    @property
+    def sites(self) -> tuple[Mapping, ...]:
+        return self._raw.get('sites', ())
+
+    @property
+    def template(self) -> str | None:
+        return self._raw.get('template')
+
+    @property
+    def archive(self) -> str | None:
+        return self._raw.get('archive')
+
+    @property
+    def compression_level(self) -> int | None:
+        return self._raw.get('compression level')
+
+    @property
+    def metrics(self) -> Mapping:
+        return self._raw.get('metrics', _EMPTY)
+
+    @property
+    def daemon(self) -> Mapping:
+        return self._raw.get('daemon', _EMPTY)
+
+    @property
+    def safety_rules(self) -> tuple[Mapping, ...] | None:
+        return self._raw.get('safety rules')
+
+
+_EMPTY = MappingProxyType({})
+
+# None until load() is run
+CONFIG: Config = None
+
+# modification time of the config file CONFIG was read from, None when it
+# wasn't read from the file
+_mtime: int = None
+
+
+def read(path: Path = None) -> Config:
+    '''
+    Read and validate a config file, CONFIG_PATH by default
+    Raises FileNotFoundError, json.JSONDecodeError or ConfigError
+    '''
+    with open(path or CONFIG_PATH) as f:
+        return Config(json.load(f))
 
 
 def load():
-    '''Load or create a config file'''
-    project_dir = Path(__file__).absolute().parent.parent
+    '''
+    Load or create a config file, only reading it again once it has changed.
+    Exits listing its problems when it isn't valid
+    '''
+    global CONFIG, _mtime
     try:
-        with open(f'{project_dir}/config.json') as f:
-            global CONFIG 
-            CONFIG = json.load(f)
+        mtime = CONFIG_PATH.stat().st_mtime_ns
+        if mtime == _mtime:
+            return
+        CONFIG, _mtime = read(), mtime
     except FileNotFoundError:
         print('config file not found')
         generate_config_file()
@@ -27,6 +206,191 @@ def load():
         else:
             print('Exiting program')
             sys.exit()
+    except ConfigError as error:
+        sys.exit(f'{CONFIG_PATH} is not valid\n{error}')
+
+
+def reload() -> bool:
+    '''
+    Read the config file again if it has changed since load(). When the
+    changed file isn't valid its problems are printed and CONFIG is kept
+    Returns whether CONFIG changed
+    '''
+    global CONFIG, _mtime
+    if _mtime is None:
+        return False
+    try:
+        mtime = CONFIG_PATH.stat().st_mtime_ns
+        if mtime == _mtime:
+            return False
+        _mtime = mtime
+        CONFIG = read()
+    except (OSError, json.JSONDecodeError, ConfigError) as error:
+        print(f'ERROR: {CONFIG_PATH} changed but is not valid, keeping the '
+              f'config already loaded\n{error}')
+        return False
+    print(f'reloaded {CONFIG_PATH}')
+    return True
+
+
+def validate(raw: dict) -> list[str]:
+    '''Problems with a config, an empty list if there are none'''
+    if not isinstance(raw, dict):
+        return ['the config should be a JSON object']
+    problems = _wrong_types(raw, OPTIONAL, '')
+    sites = raw.get('sites') or [{}]
+    if not isinstance(sites, list):
+        return problems
+    for site in sites:
+        if not isinstance(site, dict):
+            problems.append('each site should be a JSON object')
+            continue
+        where = f' in site {site["name"]}' if 'name' in site else ''
+        if raw.get('sites') and 'name' not in site:
+            problems.append('a site is missing "name"')
+        merged = {**raw, **site}
+        for key, kind in REQUIRED.items():
+            if key not in merged:
+                problems.append(f'missing "{key}"{where}')
+            elif not isinstance(merged[key], kind):
+                problems.append(f'"{key}"{where} should be a {kind.__name__}')
+        problems.extend(_wrong_types(merged, SITE_OPTIONAL, where))
+        hours = merged.get('forecast hours')
+        if isinstance(hours, list):
+            problems.extend(_wrong_hours(hours, f'"forecast hours"{where}'))
+        output = merged.get('output location')
+        if isinstance(output, str) and not Path(output or '.').is_dir():
+            problems.append(f'"output location"{where} {output} does not exist')
+    level = raw.get('compression level', 0)
+    if isinstance(level, int) and not 0 <= level <= 9:
+        problems.append('"compression level" should be a number from 0 to 9')
+    rules = raw.get('safety rules', [])
+    if isinstance(rules, list):
+        for number, rule in enumerate(rules, 1):
+            problems.extend(_rule_problems(rule, f'safety rule {number}'))
+    if isinstance(raw.get('metrics'), dict):
+        problems.extend(_wrong_types(raw['metrics'], METRICS_OPTIONAL,
+                                     ' in "metrics"'))
+    if isinstance(raw.get('daemon'), dict):
+        problems.extend(_daemon_problems(raw['daemon']))
+    problems.extend(_missing_paths(raw))
+    return problems
+
+
+def _missing_paths(raw: dict) -> list[str]:
+    '''
+    the template and the directories of files written outside the output
+    location which don't exist, rather than failing after everything is
+    fetched
+    '''
+    problems = []
+    template = raw.get('template')
+    if isinstance(template, str) and not Path(template).is_file():
+        problems.append(f'"template" {template} does not exist')
+    paths = {'"archive"': raw.get('archive')}
+    if isinstance(raw.get('metrics'), dict):
+        paths.update((f'"{key}" in "metrics"', raw['metrics'].get(key))
+                     for key in METRICS_OPTIONAL)
+    for what, path in paths.items():
+        # an empty path is the default, or not written at all
+        if isinstance(path, str) and path and \
+                not Path(path).absolute().parent.is_dir():
+            problems.append(f'the directory of {what} {path} does not exist')
+    return problems
+
+
+def _daemon_problems(daemon: dict) -> list[str]:
+    problems = []
+    try:
+        if 'generate at' in daemon:
+            time.fromisoformat(daemon['generate at'])
+    except (TypeError, ValueError):
+        problems.append('"generate at" in "daemon" should be a time like "06:30"')
+    refresh = daemon.get('refresh minutes', {})
+    if not isinstance(refresh, dict):
+        return problems + ['"refresh minutes" in "daemon" should be a dict']
+    for source, minutes in refresh.items():
+        if source not in REFRESHED:
+            problems.append(f'"refresh minutes" in "daemon" has "{source}", '
+                            f'only {" and ".join(REFRESHED)} are refreshed')
+        elif isinstance(minutes, bool) or \
+                not isinstance(minutes, (int, float)) or minutes <= 0:
+            problems.append(f'"{source}" in "refresh minutes" should be a '
+                            'number of minutes above 0')
+    return problems
+
+
+def _rule_problems(rule: dict, where: str) -> list[str]:
+    '''problems with a safety rule, which rules.Rule would only find later'''
+    if not isinstance(rule, dict):
+        return [f'{where} should be a JSON object']
+    problems = [f'{where} is missing "{key}"'
+                for key in RULE_REQUIRED if key not in rule]
+    problems.extend(f'{where} has unknown "{key}"' for key in rule
+                    if key not in RULE_REQUIRED and key not in RULE_OPTIONAL)
+    problems.extend(_wrong_types(rule, {**RULE_REQUIRED, **RULE_OPTIONAL},
+                                 f' in {where}'))
+    if problems:
+        return problems
+
+    for key, allowed in (('series', RULE_SERIES), ('op', RULE_OPS),
+                         ('report', RULE_REPORTS)):
+        if key in rule and rule[key] not in allowed:
+            problems.append(f'"{key}" in {where} should be one of '
+                            f'{", ".join(allowed)}')
+    if rule.get('report') == 'windows' and (rule['series'] != 'tide' or
+                                            rule['op'] == '=='):
+        problems.append(f'{where} reports windows, which are only reported '
+                        'for the tide being above or below a level')
+    if 'hours' in rule:
+        problems.extend(_wrong_hours(rule['hours'], f'"hours" in {where}'))
+    try:
+        fields = {field for _, field, _, _ in Formatter().parse(rule['message'])
+                  if field is not None}
+    except ValueError:
+        fields = None
+    if fields is None or not fields <= {'start', 'end'}:
+        problems.append(f'"message" in {where} may only use {{start}} and '
+                        '{end}')
+    return problems
+
+
+def _wrong_hours(hours: list, what: str) -> list[str]:
+    if len(hours) == 2 and all(isinstance(hour, int) and
+                               not isinstance(hour, bool) and 0 <= hour <= 23
+                               for hour in hours) and hours[0] <= hours[1]:
+        return []
+    return [f'{what} should be the first and last hour e.g. [10, 18]']
+
+
+def _wrong_types(raw: dict, schema: dict, where: str) -> list[str]:
+    problems = []
+    for key, kind in schema.items():
+        kinds = kind if isinstance(kind, tuple) else (kind,)
+        # bools are ints to isinstance, but never meant as one here
+        if key in raw and (not isinstance(raw[key], kinds) or
+                           isinstance(raw[key], bool) and bool not in kinds):
+            names = ' or '.join(kind.__name__ for kind in kinds)
+            article = 'an' if names[0] in 'aeiou' else 'a'
+            problems.append(f'"{key}"{where} should be {article} {names}')
+    return problems
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item)
+                                 for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
 
 
 def get_bool_from_user(message: str, default=True) -> bool:
@@ -40,12 +404,12 @@ def get_bool_from_user(message: str, default=True) -> bool:
         
 
 def generate_config_file():
-    global CONFIG 
-    CONFIG = dict()
+    global CONFIG, _mtime
+    raw = dict()
     print('\nEMPLOYEES')
-    CONFIG['employees'] = [] 
+    raw['employees'] = []
     while get_bool_from_user('add employee [Y\\n]'):
-        CONFIG['employees'].append(input('employee: '))
+        raw['employees'].append(input('employee: '))
 
     token = get_token()
     calendars = get_calendars(token)
@@ -53,7 +417,7 @@ def generate_config_file():
         token = get_token()
         calendars = get_calendars(token)
 
-    CONFIG['personal access token'] = token
+    raw['personal access token'] = token
 
     print('\nSelect a Calendar')
     for i in range(len(calendars)):
@@ -68,18 +432,26 @@ def generate_config_file():
         except ValueError:
             print('invalid input')
 
-    CONFIG['calendar ID'] = calendars[int(cal)][1]
-    CONFIG['output location'] = input('path to output folder: ')
-    with open('config.json', 'w') as f:
-        json.dump(CONFIG, f, indent=2)
+    raw['calendar ID'] = calendars[int(cal)][1]
+    raw['output location'] = input('path to output folder: ')
+    raw['api key'] = input('WeatherAPI key: ')
+    with open(CONFIG_PATH, 'w') as f:
+        json.dump(raw, f, indent=2)
+
+    try:
+        CONFIG, _mtime = Config(raw), CONFIG_PATH.stat().st_mtime_ns
+    except ConfigError as error:
+        sys.exit(f'{CONFIG_PATH} is not valid\n{error}')
 
 
 def get_calendars(token: str):
+    # requests is slow to import and only needed here, not to read the config
+    import upstream
     base_url = 'https://timetreeapis.com/calendars'
     headers = {'Accept': 'application/vnd.timetree.v1+json',
                'Authorization': f'Bearer {token}'
               }
-    res = requests.get(base_url, headers=headers)
+    res = upstream.client.get(base_url, headers=headers)
     if res.ok:
         raw_calendars = res.json()['data']
         return [(cal['attributes']['name'], cal['id']) for cal in raw_calendars]
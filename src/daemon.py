@@ -0,0 +1,196 @@
+"""
+resident scheduler mode
+
+    python3 main.py --daemon
+
+keeps running so the imports, the template, the weather icons, the render
+worker processes and the upstream connections are only set up once. Tides
+for today and tomorrow are fetched ahead of time, since they're fixed
+predictions, and the forecast is refreshed on a schedule. At "generate at"
+the day's documents are written from the data already held, only the
+bookings are fetched right before. Changes to config.json are picked up
+without restarting. Set in config.json e.g.
+
+  "daemon": {
+    "generate at": "06:30",
+    "refresh minutes": {"tides": 360, "weather": 60}
+  }
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+import threading
+import time as clock
+
+from fetch import Source, fetch_all
+from mmg import upstream_sources, worker_pool, write_documents
+from sites import Site, load_sites
+import config
+import icons
+import metrics
+import template
+
+
+GENERATE_AT = time(6)
+
+# minutes between fetches while waiting to generate, bookings aren't
+# refreshed in the background, they're fetched right before generating
+REFRESH_MINUTES = {'tides': 6 * 60, 'weather': 60}
+
+# longest sleep between checks, so a changed clock or a new day is noticed
+MAX_WAIT = 60
+
+
+class Daemon:
+
+    def __init__(self, sites: list[Site], generate_at: time = GENERATE_AT,
+                 refresh_minutes: dict = None, days: int = 1):
+        '''
+        sites: the sites to generate documents for
+        generate_at: local time to write each day's documents
+        refresh_minutes: minutes between background fetches of each upstream
+        days: number of days from today to write documents for
+        '''
+        self.sites = sites
+        self.generate_at = generate_at
+        self.refresh_minutes = refresh_minutes or REFRESH_MINUTES
+        self.days = days
+
+        # fetch_all results by source name, and when and which day each
+        # source was last fetched
+        self.data: dict[str, dict] = {}
+        self.fetched_at: dict[str, float] = {}
+        self.fetched_on: dict[str, date] = {}
+
+        self.next_run: datetime = None
+        self.pool: ProcessPoolExecutor = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, days: int = 1) -> 'Daemon':
+        config.load()
+        return cls(load_sites(), *_schedule(), days)
+
+    def reconfigure(self):
+        '''
+        Pick up a changed config, the render workers are restarted so
+        they have it too
+        '''
+        self.sites = load_sites()
+        self.generate_at, self.refresh_minutes = _schedule()
+        self.next_run = None
+        template.load(config.CONFIG.template)
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self._start_pool()
+
+    def due(self, now: datetime) -> list[Source]:
+        '''
+        The background sources which have to be fetched, the ones not
+        fetched yet today or not for their refresh interval
+        '''
+        today = now.date()
+
+        # one day past the documents' days, so tomorrow is ready at midnight
+        sources = upstream_sources(self.sites, today, self.days + 1)
+        due = []
+        for src in sources:
+            kind = src.name.split(':')[0]
+            if kind not in self.refresh_minutes:
+                continue
+            age = clock.monotonic() - self.fetched_at.get(src.name, float('-inf'))
+            if self.fetched_on.get(src.name) != today or \
+                    age >= self.refresh_minutes[kind] * 60:
+                due.append(src)
+        return due
+
+    def refresh(self, sources: list[Source], today: date):
+        '''
+        Fetch sources, keeping the data held from the last fetch of a
+        source which fails
+        '''
+        if not sources:
+            return
+        results = fetch_all(sources)
+        for src in sources:
+            if results[src.name] or src.name not in self.data:
+                self.data[src.name] = results[src.name]
+            if results[src.name]:
+                self.fetched_at[src.name] = clock.monotonic()
+                self.fetched_on[src.name] = today
+
+    def warm(self, now: datetime):
+        '''load what the first document would otherwise have to'''
+        self.refresh(self.due(now), now.date())
+        template.load(config.CONFIG.template)
+        for name, days in self.data.items():
+            if name.startswith('weather:'):
+                for hours in days.values():
+                    for hour in hours:
+                        icons.load(hour.emoji)
+
+        self._start_pool()
+
+    def _start_pool(self):
+        jobs = len(self.sites) * self.days
+        if jobs > 1 and self.pool is None:
+            self.pool = worker_pool(jobs)
+
+    def generate(self, now: datetime) -> list:
+        '''Write today's documents, fetching only what isn't fresh'''
+        today = now.date()
+        self.refresh(self.due(now), today)
+        self.refresh([src for src in upstream_sources(self.sites, today,
+                                                      self.days)
+                      if src.name.startswith('bookings:')], today)
+        return write_documents(self.data, today, self.days, self.sites,
+                               pool=self.pool)
+
+    def next_generation(self, now: datetime) -> datetime:
+        at = datetime.combine(now.date(), self.generate_at)
+        return at if at > now else at + timedelta(days=1)
+
+    def tick(self, now: datetime) -> float:
+        '''
+        Do whatever is due at now
+        Returns the seconds to wait before the next tick
+        '''
+        if config.reload():
+            self.reconfigure()
+        if self.next_run is None:
+            self.next_run = self.next_generation(now)
+        if now >= self.next_run:
+            self.next_run = self.next_generation(now)
+            try:
+                with metrics.span('daemon generate'):
+                    self.generate(now)
+            except Exception as error:
+                # tomorrow's run shouldn't be lost to today's failure
+                print(f'ERROR: Unable to generate documents ({error!r})')
+            metrics.export(config.CONFIG.metrics)
+        else:
+            self.refresh(self.due(now), now.date())
+        return min((self.next_run - now).total_seconds(), MAX_WAIT)
+
+    def run(self):
+        '''Tick until stop() is called'''
+        self.warm(datetime.now())
+        print(f'generating at {self.generate_at.strftime("%H:%M")} daily')
+        try:
+            while not self._stop.is_set():
+                self._stop.wait(max(self.tick(datetime.now()), 0))
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+
+def _schedule() -> tuple[time, dict]:
+    '''"generate at" and "refresh minutes" from the loaded config'''
+    settings = config.CONFIG.daemon
+    generate_at = settings.get('generate at')
+    return (time.fromisoformat(generate_at) if generate_at else GENERATE_AT,
+            {**REFRESH_MINUTES, **settings.get('refresh minutes', {})})
@@ -0,0 +1,58 @@
+"""
+fetch stage for the morning meeting generator
+
+the tide scrape, weather call and TimeTree call don't depend on each other,
+so they are run at the same time on a small thread pool. Each source gets its
+own timeout, and a source that fails or times out falls back to an empty
+default instead of taking the other two down with it.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+import time
+
+import metrics
+
+
+@dataclass
+class Source:
+    name: str
+
+    # zero argument callable which returns the fetched data
+    fetch: Callable[[], Any]
+
+    # seconds, measured from the start of the fetch stage
+    timeout: float = 10
+
+    # called to produce a stand in value when the fetch fails
+    default: Callable[[], Any] = list
+
+
+def fetch_all(sources: list[Source]) -> dict[str, Any]:
+    '''
+    Run every source's fetch concurrently
+    Returns a dict of results keyed by source name
+    '''
+    executor = ThreadPoolExecutor(max_workers=len(sources),
+                                  thread_name_prefix='fetch')
+    start = time.monotonic()
+    futures = {src.name: executor.submit(src.fetch) for src in sources}
+
+    results = {}
+    for src in sources:
+        remaining = max(src.timeout - (time.monotonic() - start), 0)
+        try:
+            results[src.name] = futures[src.name].result(timeout=remaining)
+        except TimeoutError:
+            print(f'ERROR: Timed out retrieving {src.name} data')
+            metrics.event('fetch', source=src.name, error='timed out')
+            results[src.name] = src.default()
+        except Exception as error:
+            print(f'ERROR: Unable to retrieve {src.name} data ({error!r})')
+            metrics.event('fetch', source=src.name, error=repr(error))
+            results[src.name] = src.default()
+
+    # don't wait on a source which has already timed out
+    executor.shutdown(wait=False, cancel_futures=True)
+    return results
@@ -0,0 +1,225 @@
+"""
+compact columnar storage for hourly tides and weather
+
+an HourlySeries keeps the time of its first hour and one fixed width array
+per column instead of a dataclass per hour. Tide and Weather objects are
+built on demand when an hour is looked up, so code written against lists of
+Tide or Weather keeps working unchanged. Views are copies, changing one
+doesn't change the series.
+
+a Forecast holds every hour of a multi day forecast in a single series, and
+a window of hours of one of its days is a slice of it.
+"""
+
+from abc import abstractmethod
+from array import array
+from collections.abc import Mapping, Sequence
+from datetime import date, datetime, timedelta
+from math import ceil, isnan
+
+import Tide
+import timestamps
+import Weather
+
+
+NAN = float('nan')
+
+COMPASS = ('N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+           'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW')
+
+
+class Hours(Sequence):
+    '''the time of each hour of a series, only built when looked up'''
+
+    __slots__ = ('start', 'length')
+
+    def __init__(self, start: datetime, length: int):
+        self.start = start
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> datetime:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('hour index out of range')
+        return self.start + timedelta(hours=int(index))
+
+
+class HourlySeries(Sequence):
+
+    __slots__ = ('start', 'columns')
+
+    # column name -> array typecode, set by subclasses
+    COLUMNS: dict[str, str] = {}
+
+    def __init__(self, start: datetime, columns: dict[str, array] = None):
+        self.start = start
+        self.columns = columns or {name: array(code)
+                                   for name, code in self.COLUMNS.items()}
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('hourly series can only be sliced by hour')
+            return type(self)(self.time(first),
+                              {name: column[first:stop]
+                               for name, column in self.columns.items()},
+                              *self._shared())
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('hourly series index out of range')
+        return self._view(index)
+
+    def __eq__(self, other):
+        if isinstance(other, HourlySeries):
+            return self.start == other.start and list(self) == list(other)
+        return list(self) == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return (type(self), (self.start, self.columns, *self._shared()))
+
+    @property
+    def times(self) -> Hours:
+        return Hours(self.start, len(self))
+
+    def time(self, index: int) -> datetime:
+        return self.start + timedelta(hours=index)
+
+    def _shared(self) -> tuple:
+        '''constructor arguments after the columns, for copies'''
+        return ()
+
+    @abstractmethod
+    def _view(self, index: int):
+        '''the hour at index as a Tide or Weather'''
+
+
+class TideSeries(HourlySeries):
+    '''hourly predicted heights, NaN where the station page is blank'''
+
+    __slots__ = ()
+
+    COLUMNS = {'meters': 'd'}
+
+    def append(self, meters: float):
+        self.columns['meters'].append(NAN if meters is None else meters)
+
+    def _view(self, index: int) -> 'Tide.Tide':
+        meters = self.columns['meters'][index]
+        if isnan(meters):
+            return Tide.Tide(self.time(index), None, None)
+        return Tide.Tide(self.time(index), meters, '%.1f' % (meters * 3.2808))
+
+
+class WeatherSeries(HourlySeries):
+    '''
+    hourly forecast, the condition and wind direction columns index into
+    the series' conditions list and COMPASS
+    '''
+
+    __slots__ = ('conditions',)
+
+    COLUMNS = {
+        'temp': 'h',
+        'uv': 'd',
+        'wind_kph': 'H',
+        'wind_dir': 'B',
+        'condition': 'H',
+    }
+
+    def __init__(self, start: datetime, columns: dict[str, array] = None,
+                 conditions: list[tuple[str, str]] = None):
+        super().__init__(start, columns)
+
+        # (description, emoji) pairs
+        self.conditions = conditions if conditions is not None else []
+
+    @classmethod
+    def from_api_hours(cls, hours: list[dict]) -> 'WeatherSeries':
+        '''Build a series from consecutive hours of a WeatherAPI forecast'''
+        if not hours:
+            return cls(None)
+        series = cls(timestamps.parse_iso(hours[0]['time']))
+        for hour in hours:
+            series.append_api_hour(hour)
+        return series
+
+    def append_api_hour(self, hour: dict):
+        # icon is originally a url, [20:] remove upto the ....com/ from the url
+        condition = (hour['condition']['text'], hour['condition']['icon'][20:])
+        if condition not in self.conditions:
+            self.conditions.append(condition)
+        self.columns['temp'].append(ceil(hour['temp_c']))
+        self.columns['uv'].append(hour['uv'])
+        self.columns['wind_kph'].append(round(hour['wind_kph']))
+        self.columns['wind_dir'].append(COMPASS.index(hour['wind_dir']))
+        self.columns['condition'].append(self.conditions.index(condition))
+
+    def __len__(self) -> int:
+        return len(self.columns['temp'])
+
+    def _shared(self) -> tuple:
+        return (self.conditions,)
+
+    def _view(self, index: int) -> 'Weather.Weather':
+        description, emoji = self.conditions[self.columns['condition'][index]]
+        wind = f"{COMPASS[self.columns['wind_dir'][index]]} " \
+               f"{self.columns['wind_kph'][index]}"
+        uv = self.columns['uv'][index]
+        return Weather.Weather(self.time(index), description, emoji,
+                       self.columns['temp'][index], wind,
+                       int(uv) if uv.is_integer() else uv)
+
+
+class Forecast(Mapping):
+    '''
+    every hour of a WeatherAPI forecast, parsed once, keyed by day. Any
+    window of hours of any of its days is sliced out of the one series
+    '''
+
+    __slots__ = ('series',)
+
+    def __init__(self, series: WeatherSeries):
+        self.series = series
+
+    @classmethod
+    def from_api_days(cls, days: list[dict]) -> 'Forecast':
+        '''from a response's forecastday list, which has 24 hours a day'''
+        return cls(WeatherSeries.from_api_hours(
+            [hour for day in days for hour in day['hour']]))
+
+    def window(self, day: date, first: int = 0,
+               last: int = 23) -> WeatherSeries:
+        '''the hours of day from first to last inclusive'''
+        if day not in self:
+            raise KeyError(day)
+        offset = self._offset(day)
+        return self.series[offset + first:offset + last + 1]
+
+    def __getitem__(self, day: date) -> WeatherSeries:
+        return self.window(day)
+
+    def __contains__(self, day) -> bool:
+        return isinstance(day, date) and self.series.start is not None and \
+            0 <= self._offset(day) < len(self.series)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.series.start.date() + timedelta(days=i)
+
+    def __len__(self) -> int:
+        return len(self.series) // 24 if self.series.start else 0
+
+    def _offset(self, day: date) -> int:
+        return (day - self.series.start.date()).days * 24
@@ -0,0 +1,54 @@
+"""
+weather icons for the meeting documents
+
+icon files under img/weather are read once per process and kept in memory,
+and an IconStore embeds each distinct icon in its document once, every
+later use of the icon refers to the same image part.
+"""
+
+from io import BytesIO
+from pathlib import Path
+import threading
+
+from docx.document import Document
+from docx.oxml.shape import CT_Inline
+from docx.shape import InlineShape
+from docx.text.run import Run
+
+
+IMG_DIR = Path(__file__).absolute().parent.parent / 'img'
+
+_icons: dict[str, bytes] = {}
+_lock = threading.Lock()
+
+
+def load(emoji: str) -> bytes:
+    '''
+    emoji: path of the icon under img, as stored in Weather.emoji
+    e.g. /weather/64x64/day/113.png
+    '''
+    with _lock:
+        if emoji not in _icons:
+            _icons[emoji] = (IMG_DIR / emoji.lstrip('/')).read_bytes()
+        return _icons[emoji]
+
+
+class IconStore:
+
+    def __init__(self, document: Document):
+        self.part = document.part
+
+        # emoji -> (relationship id, docx Image) of parts already embedded
+        self._embedded = {}
+
+    def add_picture(self, run: Run, emoji: str, width: int) -> InlineShape:
+        '''Add the icon to the end of run, scaled to width'''
+        if emoji not in self._embedded:
+            self._embedded[emoji] = self.part.get_or_add_image(
+                BytesIO(load(emoji)))
+        rId, image = self._embedded[emoji]
+        cx, cy = image.scaled_dimensions(width, None)
+        inline = CT_Inline.new_pic_inline(self.part.next_id, rId,
+                                          image.filename, cx, cy)
+        run._r.add_drawing(inline)
+        return InlineShape(inline)
@@ -1,9 +1,142 @@
-from mmg import MeetingDocumentGenerator
+"""
+command line entry point
 
-def main(): 
-    meeting_doc = MeetingDocumentGenerator()
-    meeting_doc.generate()
-    meeting_doc.write_to_file()
+    python3 main.py [--days N] [--start YYYY-MM-DD] [--force] [--daemon]
+                    [--record DIR | --replay DIR]
+    python3 main.py validate-config
+    python3 main.py list-calendars
+    python3 main.py serve [--host HOST] [--port PORT]
+
+each command imports only the modules it needs, so checking the config
+doesn't wait on requests, NumPy and python-docx being loaded.
+"""
+
+from datetime import date
+import argparse
+import json
+import sys
+
+import config
+
+
+def generate(args):
+    # a config with problems fails here, before anything slow is imported
+    config.load()
+
+    import metrics
+    import replay
+    import timestamps
+    from mmg import generate_range
+
+    if args.record:
+        replay.start(args.record, 'record')
+    elif args.replay:
+        replay.start(args.replay, 'replay')
+    if args.daemon:
+        import daemon
+        try:
+            daemon.Daemon.from_config(args.days).run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            replay.stop()
+        return
+
+    try:
+        with metrics.span('run', days=args.days) as attributes:
+            paths = generate_range(args.start or timestamps.today(), args.days,
+                                   force=args.force)
+            attributes['documents written'] = len(paths)
+    finally:
+        replay.stop()
+        if config.CONFIG is not None:
+            metrics.export(config.CONFIG.metrics)
+
+
+def validate_config(args):
+    try:
+        config.read()
+    except FileNotFoundError:
+        sys.exit(f'{config.CONFIG_PATH} not found, run main.py to create it')
+    except json.JSONDecodeError as error:
+        sys.exit(f'{config.CONFIG_PATH} is not valid JSON ({error})')
+    except config.ConfigError as error:
+        print(error)
+        sys.exit(1)
+    print(f'{config.CONFIG_PATH} is valid')
+
+
+def list_calendars(args):
+    config.load()
+    calendars = config.get_calendars(config.CONFIG.personal_access_token)
+    if not calendars:
+        sys.exit('Unable to retrieve calendars, check the personal access token')
+    for name, cal_id in calendars:
+        print(f'{cal_id}  {name}')
+
+
+def serve(args):
+    config.load()
+
+    import asyncio
+    import server
+    from sites import load_sites
+
+    service = server.MeetingService(load_sites())
+    try:
+        asyncio.run(server.serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate the morning meeting document')
+    parser.set_defaults(command=generate)
+    parser.add_argument('--days', type=_days, default=1,
+        help='number of consecutive days to generate documents for (max 7)')
+    parser.add_argument('--start', type=date.fromisoformat, default=None,
+        help='first day to generate a document for as YYYY-MM-DD, '
+             'defaults to today')
+    parser.add_argument('--force', action='store_true',
+        help='write documents even if nothing in them has changed')
+    parser.add_argument('--daemon', action='store_true',
+        help='keep running and generate the documents every day at the '
+             'time set in config.json')
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument('--record', metavar='DIR', default=None,
+        help='save the upstream responses to DIR')
+    recording.add_argument('--replay', metavar='DIR', default=None,
+        help='use the responses saved to DIR instead of the upstreams, '
+             'as if it was the day they were recorded')
+
+    commands = parser.add_subparsers(title='other commands')
+    commands.add_parser('validate-config',
+        help='check config.json without contacting any upstream') \
+        .set_defaults(command=validate_config)
+    commands.add_parser('list-calendars',
+        help='list the TimeTree calendars the access token can see') \
+        .set_defaults(command=list_calendars)
+    serve_parser = commands.add_parser('serve',
+        help='serve meeting documents and their data over HTTP')
+    serve_parser.set_defaults(command=serve)
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+
+    args = parser.parse_args()
+
+    # a replay's today is the day it was recorded, only known once it starts
+    if args.start and not args.replay and args.start < date.today():
+        parser.error('argument --start: bookings are only available from '
+                     'today')
+    args.command(args)
+
+
+def _days(value: str) -> int:
+    days = int(value)
+    if not 1 <= days <= 7:
+        raise argparse.ArgumentTypeError(f'{value} is not from 1 to 7')
+    return days
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,70 @@
+"""
+run manifest for incremental regeneration
+
+records a hash of the inputs of every section of each document written.
+When a rerun's inputs hash the same and the document is still on disk,
+there's nothing to write. Which upstreams are re-fetched is decided by the
+response cache, each source is only downloaded again once its time to live
+has passed, or revalidated cheaply with the server.
+"""
+
+from collections.abc import Sequence
+from dataclasses import asdict, is_dataclass
+from datetime import date, datetime
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from atomic import atomic_write
+
+
+MANIFEST_PATH = Path(__file__).absolute().parent.parent / '.cache' / 'manifest.json'
+
+
+def digest(value) -> str:
+    '''hash of a section's inputs, dataclasses and dates included'''
+    raw = json.dumps(value, default=json_default, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def json_default(value):
+    '''json.dumps default for document data, as digest hashes it'''
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Sequence):
+        # hourly series, encoded the same as a list of their hours
+        return list(value)
+    return str(value)
+
+
+class Manifest:
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or MANIFEST_PATH)
+        try:
+            self.documents: dict[str, dict[str, str]] = \
+                json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.documents = {}
+
+    def changed(self, document_path: str, sections: dict[str, str]) -> list[str]:
+        '''
+        Names of the sections whose hashes differ from the last time the
+        document was written, every section if it's no longer on disk
+        '''
+        if not os.path.exists(document_path):
+            return list(sections)
+        previous = self.documents.get(document_path, {})
+        return [name for name, value in sections.items()
+                if previous.get(name) != value]
+
+    def update(self, document_path: str, sections: dict[str, str]):
+        self.documents[document_path] = sections
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(self.path, 'w') as f:
+            json.dump(self.documents, f, indent=2)
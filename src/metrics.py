@@ -0,0 +1,197 @@
+"""
+instrumentation for each run of the generator
+
+the fetchers, safety topics and document saving are wrapped in spans, and
+every upstream request is a span of its own with its status code, payload
+size and whether it was served from the cache. At the end of a run the
+spans can be written as JSON lines and as a Prometheus textfile, which are
+set in config.json e.g.
+
+  "metrics": {
+    "log": "/var/log/morning-meeting/runs.jsonl",
+    "prometheus": "/var/lib/node_exporter/textfile_collector/mmg.prom"
+  }
+
+either may be left out. Spans are only kept in memory when neither is set.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from pathlib import Path
+import json
+import os
+import threading
+import time
+import uuid
+
+from atomic import atomic_write
+
+
+@dataclass
+class Span:
+    name: str
+    # unix time the span started
+    start: float
+    seconds: float
+    attributes: dict = field(default_factory=dict)
+    pid: int = field(default_factory=os.getpid)
+
+    @property
+    def status(self) -> str:
+        return 'error' if 'error' in self.attributes else 'ok'
+
+
+class Recorder:
+    '''collects the finished spans of a run, from any thread'''
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def extend(self, spans: list[Span]):
+        '''add spans recorded by another process'''
+        with self._lock:
+            self.spans.extend(spans)
+
+    def drain(self) -> list[Span]:
+        '''remove and return every span recorded so far'''
+        with self._lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+
+recorder = Recorder()
+
+# attributes of the innermost open span in this thread
+_current: ContextVar[dict] = ContextVar('span', default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    '''
+    Time the body of a with statement, the attributes dict it yields and
+    annotate() can add to the span while it's open. An exception raised in
+    the body is recorded as the span's error
+    '''
+    token = _current.set(attributes)
+    start, perf = time.time(), time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as error:
+        attributes['error'] = repr(error)
+        raise
+    finally:
+        _current.reset(token)
+        recorder.record(Span(name, start, time.perf_counter() - perf,
+                             attributes))
+
+
+def instrument(func):
+    '''run every call to func in a span named after it'''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__qualname__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def annotate(**attributes):
+    '''add attributes to the innermost open span, if there is one'''
+    current = _current.get()
+    if current is not None:
+        current.update(attributes)
+
+
+def event(name: str, **attributes):
+    '''record something which happened at a point in time, such as a timeout'''
+    recorder.record(Span(name, time.time(), 0, attributes))
+
+
+def json_lines(spans: list[Span], run: str) -> str:
+    lines = []
+    for span in spans:
+        record = asdict(span)
+        attributes = record.pop('attributes')
+        lines.append(json.dumps({'run': run, **record, 'status': span.status,
+                                 **attributes}, default=str))
+    return ''.join(line + '\n' for line in lines)
+
+
+def prometheus(spans: list[Span], finished: float = None) -> str:
+    '''the run's spans in the Prometheus text exposition format'''
+    durations, errors, counts = {}, {}, {}
+    statuses, sizes, hits, requests = {}, {}, {}, {}
+    for span in spans:
+        durations[span.name] = durations.get(span.name, 0) + span.seconds
+        counts[span.name] = counts.get(span.name, 0) + 1
+        errors[span.name] = errors.get(span.name, 0) + (span.status == 'error')
+        if span.name == 'upstream':
+            source = span.attributes.get('source')
+            requests[source] = requests.get(source, 0) + 1
+            hits[source] = hits.get(source, 0) + \
+                bool(span.attributes.get('cache hit'))
+            sizes[source] = sizes.get(source, 0) + \
+                span.attributes.get('bytes', 0)
+            if 'status code' in span.attributes:
+                statuses[source] = span.attributes['status code']
+
+    metrics = [
+        ('mmg_span_seconds', 'gauge',
+         'seconds spent in each span during the last run', 'span', durations),
+        ('mmg_span_calls', 'gauge',
+         'times each span was entered during the last run', 'span', counts),
+        ('mmg_span_errors', 'gauge',
+         'spans which failed during the last run', 'span', errors),
+        ('mmg_upstream_requests', 'gauge',
+         'upstream requests made during the last run', 'source', requests),
+        ('mmg_upstream_cache_hits', 'gauge',
+         'upstream requests answered from the response cache', 'source', hits),
+        ('mmg_upstream_response_bytes', 'gauge',
+         'bytes received from each upstream during the last run', 'source',
+         sizes),
+        ('mmg_upstream_status_code', 'gauge',
+         'status code of the last response from each upstream', 'source',
+         statuses),
+    ]
+    lines = []
+    for name, kind, description, label, values in metrics:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(values.items(), key=lambda item: str(item[0])):
+            lines.append(f'{name}{{{label}="{_escape(key)}"}} {value}')
+    lines.append('# HELP mmg_last_run_timestamp_seconds when the last run finished')
+    lines.append('# TYPE mmg_last_run_timestamp_seconds gauge')
+    lines.append(f'mmg_last_run_timestamp_seconds {finished or time.time()}')
+    return '\n'.join(lines) + '\n'
+
+
+def export(settings: dict = None, spans: list[Span] = None) -> str:
+    '''
+    Write the spans recorded so far to the JSON log and Prometheus textfile
+    in settings, the "metrics" part of the config
+    Returns the id the run's log lines are tagged with
+    '''
+    settings = settings or {}
+    spans = recorder.drain() if spans is None else spans
+    run = uuid.uuid4().hex
+    if settings.get('log'):
+        with open(settings['log'], 'a') as f:
+            f.write(json_lines(spans, run))
+    if settings.get('prometheus'):
+        # the textfile collector may read at any time, so replace it whole
+        path = Path(settings['prometheus'])
+        # readable by node_exporter's user
+        with atomic_write(path, 'w', permissions=0o644) as f:
+            f.write(prometheus(spans))
+    return run
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
@@ -6,32 +6,245 @@ generate the morning meeting self.document for Sealegs Kayaking Adventures
 in Ladysmith, BC
 """
 
-from datetime import datetime
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
 from docx import Document
 from docx.shared import Inches
+from functools import partial
 from pathlib import Path
+from typing import IO
+import multiprocessing
+import os
 import sys
 
-from Tide import *
-from Weather import *
-from Booking import *
+from Tide import Tide, get_tide_range
+from Weather import Weather, get_forecast
+from Booking import Booking, get_bookings_range
 from SafetyTopics import SafetyTopics 
+from archive import open_archive
+from fetch import Source, fetch_all
+from icons import IconStore
+from manifest import Manifest, digest
+import metrics
+import output
+import template
+import timestamps
+from sites import Site, default_site, load_sites
 
 import config
 
 
+# how render workers are started, the fork server imports this module once
+# so each worker doesn't have to
+WORKERS = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+    else 'spawn')
+if WORKERS.get_start_method() == 'forkserver':
+    WORKERS.set_forkserver_preload(['mmg'])
+
+# seconds to wait on each upstream, including retries, before generating
+# without its data. upstream.HOST_TIMEOUTS limits each individual request
+FETCH_TIMEOUTS = {
+    'tides': 20,
+    'weather': 10,
+    'bookings': 10,
+}
+
+
+def upstream_sources(sites: list[Site] = None, start: date = None,
+                     days: int = 1) -> list[Source]:
+    '''
+    The tide, weather and booking fetches for the days from start, each
+    source is fetched once and returns its data keyed by date.
+    Sites which share a tide station, forecast location or calendar share
+    a single fetch, sources are named after what they fetch e.g. tides:7460
+    '''
+    sites = sites or load_sites()
+    start = start or timestamps.today()
+    sources = {}
+    for site in sites:
+        if f'tides:{site.station}' not in sources:
+            sources[f'tides:{site.station}'] = Source(
+                f'tides:{site.station}',
+                partial(get_tide_range, start, days, station=site.station),
+                FETCH_TIMEOUTS['tides'], default=dict)
+        # each site's forecast hours are cut from its location's forecast
+        if f'weather:{site.location}' not in sources:
+            sources[f'weather:{site.location}'] = Source(
+                f'weather:{site.location}',
+                partial(get_forecast, config.CONFIG.api_key, start, days,
+                        location=site.location),
+                FETCH_TIMEOUTS['weather'], default=dict)
+        if f'bookings:{site.calendar_id}' not in sources:
+            sources[f'bookings:{site.calendar_id}'] = Source(
+                f'bookings:{site.calendar_id}',
+                partial(get_bookings_range, site.calendar_id, start, days),
+                FETCH_TIMEOUTS['bookings'], default=dict)
+    return list(sources.values())
+
+
+def slice_day(data: dict, day: date, site: Site) -> dict:
+    '''Pick a site's data for a single day out of the fetched sources'''
+    forecast = data[f'weather:{site.location}']
+    return {
+        'tides': data[f'tides:{site.station}'].get(
+            day, {'high and low': [], 'hourly': [], 'neighbours': []}),
+        'weather': forecast.window(day, *site.forecast_hours)
+                   if day in forecast else [],
+        'bookings': data[f'bookings:{site.calendar_id}'].get(day, []),
+    }
+
+
+def fetched_sections(data: dict, day: date, site: Site) -> tuple[str, ...]:
+    '''
+    The archive sections of a site's day which were fetched, slice_day
+    fills in the others with empty defaults
+    '''
+    fetched = tuple(section for section, name in (
+        ('tides', f'tides:{site.station}'),
+        ('weather', f'weather:{site.location}'),
+        ('bookings', f'bookings:{site.calendar_id}')) if day in data[name])
+    if 'tides' in fetched and 'weather' in fetched:
+        return fetched + ('safety topics',)
+    return fetched
+
+
+def generate_range(start: date, days: int, sites: list[Site] = None,
+                   force: bool = False) -> list:
+    '''
+    Generate and save a meeting document for each site for each of the days
+    from start, fetching from each upstream only once. Documents are
+    rendered in parallel worker processes when there is more than one.
+    Documents whose inputs haven't changed since they were last written
+    are skipped unless force is set
+    Returns the paths of the saved documents
+    '''
+    config.load()
+    sites = sites or load_sites()
+    data = fetch_all(upstream_sources(sites, start, days))
+    return write_documents(data, start, days, sites, force)
+
+
+def write_documents(data: dict, start: date, days: int, sites: list[Site],
+                    force: bool = False,
+                    pool: ProcessPoolExecutor = None) -> list:
+    '''
+    Render and save the documents for the days from start from already
+    fetched data, keyed like fetch_all's results. pool is used instead of
+    starting worker processes when given, it must come from worker_pool()
+    Returns the paths of the saved documents
+    '''
+    template_path = config.CONFIG.template
+    manifest = Manifest()
+    store = open_archive(config.CONFIG.archive)
+    jobs = []
+    for site in sites:
+        for i in range(days):
+            day = start + timedelta(days=i)
+            day_data = slice_day(data, day, site)
+            meeting_doc = MeetingDocumentGenerator(day, day_data, site)
+            sections = meeting_doc.section_hashes(template_path)
+            changed = manifest.changed(meeting_doc.path, sections)
+            if not changed and not force:
+                print(f'{meeting_doc.path} is up to date')
+                continue
+            store.append(site.name, day, day_data,
+                         meeting_doc.safety_topics.topics,
+                         fetched_sections(data, day, site))
+            print(f'{meeting_doc.path}: {", ".join(changed) or "nothing"} changed')
+            jobs.append(((day, day_data, site, template_path), sections))
+
+    if len(jobs) == 1:
+        paths = [render(*jobs[0][0])]
+    elif jobs and pool is not None:
+        paths = _render_all(pool, [job for job, _ in jobs])
+    elif jobs:
+        with worker_pool(len(jobs)) as pool:
+            paths = _render_all(pool, [job for job, _ in jobs])
+    else:
+        paths = []
+
+    for path, (_, sections) in zip(paths, jobs):
+        manifest.update(path, sections)
+    manifest.save()
+
+    # archived in the background while the documents were rendered
+    store.flush()
+    return paths
+
+
+def _render_all(pool: ProcessPoolExecutor, jobs: list) -> list:
+    futures = [pool.submit(_render_in_worker, *job) for job in jobs]
+    paths = []
+    for future in futures:
+        path, spans = future.result()
+        metrics.recorder.extend(spans)
+        paths.append(path)
+    return paths
+
+
+def worker_pool(jobs: int) -> ProcessPoolExecutor:
+    '''
+    Render worker processes for jobs documents, sharing the loaded config.
+    They're started by a fork server rather than forked from this process,
+    where a lock held by the archive writer or a fetch thread at the time of
+    the fork would stay held in the worker forever
+    '''
+    return ProcessPoolExecutor(max_workers=min(jobs, os.cpu_count()),
+                               mp_context=WORKERS, initializer=init_worker,
+                               initargs=(config.CONFIG,))
+
+
+def init_worker(loaded_config: config.Config):
+    '''share the parent's config with render worker processes'''
+    config.CONFIG = loaded_config
+
+
+def _render_in_worker(*job) -> tuple:
+    '''render, passing the spans it recorded back to the parent process'''
+    path = render(*job)
+    return path, metrics.recorder.drain()
+
+
+def render(day: date, data: dict, site: Site, template_path: str = None) -> str:
+    '''
+    Generate and save a single meeting document from prefetched data
+    Returns the path of the saved document
+    '''
+    meeting_doc = MeetingDocumentGenerator(day, data, site)
+    meeting_doc.generate_from_template(template_path)
+    return meeting_doc.write_to_file()
+
+
 class MeetingDocumentGenerator:
-    def __init__(self):
-        config.load()
-        self.document = Document()
-        self.tides: dict[str, list[Tide]] = get_tides()
-        self.weather: list[Weather] = get_api_weather(10,18, config.CONFIG['api key'])
-        self.bookings: list[Booking] = get_bookings(config.CONFIG['calendar ID'])
+    def __init__(self, day: date = None, data: dict = None, site: Site = None):
+        '''
+        day: the date of the meeting, defaults to today
+        data: the day's prefetched tides, weather and bookings,
+              fetched from the upstreams when not given
+        site: the site the meeting is for, defaults to the one in config.json
+        '''
+        self.day = day or timestamps.today()
+        if data is None:
+            config.load()
+        self.site = site or default_site()
+        if data is None:
+            data = slice_day(fetch_all(upstream_sources([self.site], self.day)),
+                             self.day, self.site)
+        # created by generate or generate_from_template
+        self.document = None
+        self.icons = None
+        self.tides: dict[str, list[Tide]] = data['tides']
+        self.weather: Sequence[Weather] = data['weather']
+        self.bookings: list[Booking] = data['bookings']
         self.safety_topics = SafetyTopics(self)
         self.project_dir = Path(__file__).absolute().parent.parent
 
     def generate(self):
-        datestring = datetime.now().strftime('%A - %B %d - %Y')
+        self.document = Document()
+        self.icons = IconStore(self.document)
+        datestring = self.day.strftime('%A - %B %d - %Y')
         self.document.add_heading('Daily Safety Meeting', 0)
         self.document.add_paragraph(datestring)
 
@@ -46,19 +259,71 @@ class MeetingDocumentGenerator:
         self._add_weather()
         self._add_bookings()
 
-    def write_to_file(self):
+    def generate_from_template(self, template_path: str = None):
+        '''
+        Fill a copy of the prebuilt template rather than building the whole
+        document, uses the default template when template_path is None
+        '''
+        self.document = template.new_document(template_path)
+        self.icons = IconStore(self.document)
+        markers = template.markers(self.document)
+
+        markers[template.DATE].text = self.day.strftime('%A - %B %d - %Y')
+        markers[template.ATTENDANTS].text = ''
+        self._fill_attendants(markers[template.ATTENDANTS])
+        markers[template.SAFETY_TOPICS].text = \
+            '\n'.join(self.safety_topics.topics)
+
+        tides_table, wx_table, bookings_table = self.document.tables[:3]
+        self._fill_tides(tides_table)
+        template.fit_columns(wx_table, len(self.weather))
+        self._fill_weather(wx_table)
+        self._fill_bookings(bookings_table)
+
+    @property
+    def path(self) -> str:
+        '''where write_to_file saves the document'''
+        return self.site.output_location + self.site.file_prefix + \
+               self.day.strftime('%d-%m-%y') + '.docx'
+
+    def section_hashes(self, template_path: str = None) -> dict[str, str]:
+        '''hash of the inputs to each section of the document'''
+        return {
+            'attendants': digest(self.site.employees),
+            'safety topics': digest(self.safety_topics.topics),
+            'tides': digest(self.tides),
+            'weather': digest(self.weather),
+            'bookings': digest(self.bookings),
+            'template': digest([template_path, template_path and
+                                os.path.getmtime(template_path)]),
+        }
+
+    @metrics.instrument
+    def write_to_file(self, buffer: IO[bytes] = None) -> str:
+        '''
+        Save the document to its path, or to buffer when given, at the
+        "compression level" in config.json
+        Returns the path of the saved document, None when saved to buffer
+        '''
+        level = config.CONFIG.compression_level
+        if buffer is not None:
+            output.save(self.document, buffer, level)
+            return None
+        path = self.path
         try:
-            self.document.save(config.CONFIG['output location'] + 'morning_meeting_' + 
-                          datetime.now().strftime('%d-%m-%y') + '.docx')
+            output.save(self.document, path, level)
         except FileNotFoundError:
             print('invalid output location, path to directory does not exist')
             sys.exit()
         print('self.document successfully created')
+        return path
 
     def _add_attendants(self):
         self.document.add_heading('Attendants', 2)
-        p = self.document.add_paragraph()
-        for name in config.CONFIG['employees']:
+        self._fill_attendants(self.document.add_paragraph())
+
+    def _fill_attendants(self, p):
+        for name in self.site.employees:
             
             # Check box
             p.add_run(f'\u2751 {name}         ')
@@ -69,7 +334,9 @@ class MeetingDocumentGenerator:
 
     def _add_tides(self):
         self.document.add_heading('Tides', 2)
-        tides_table = self.document.add_table(rows=2, cols=4)
+        self._fill_tides(self.document.add_table(rows=2, cols=4))
+
+    def _fill_tides(self, tides_table):
         for idx, tide in enumerate(self.tides['high and low']):
             column_cells = tides_table.column_cells(idx)
             column_cells[0].text = tide.time.strftime('%I:%M %p').strip('0')
@@ -78,24 +345,31 @@ class MeetingDocumentGenerator:
 
     def _add_weather(self):
         self.document.add_heading('Weather', 2)
-        wx_table = self.document.add_table(rows=4, cols=len(self.weather))
+        self._fill_weather(
+            self.document.add_table(rows=4, cols=len(self.weather)))
+
+    def _fill_weather(self, wx_table):
+
+        # looking cells up by column rescans the whole table every time
+        time_row, icon_row, temp_row, wind_row = \
+            [row.cells for row in wx_table.rows]
         for i in range(len(wx_table.columns)):
-            col = wx_table.columns[i]
-            col.cells[0].text = self.weather[i].date.strftime('%I%p').lower().strip('0')
+            # hours of an hourly series are built each time they're looked up
+            hour = self.weather[i]
+            time_row[i].text = hour.date.strftime('%I%p').lower().strip('0')
 
-            # TODO: clean this up, maybe move to a seperate function; fix path use proper python dir path
-            pic_path = f"{self.project_dir}/img{self.weather[i].emoji}"
-            para = col.cells[1].paragraphs[0]
-            format = para.paragraph_format
+            para = icon_row[i].paragraphs[0]
             run = para.add_run()
-            run.add_picture(pic_path, width=Inches(.35))
+            self.icons.add_picture(run, hour.emoji, Inches(.35))
 
-            col.cells[2].text = str(self.weather[i].temp) + u'\N{DEGREE SIGN}' + 'C'
-            col.cells[3].text = self.weather[i].wind
+            temp_row[i].text = str(hour.temp) + u'\N{DEGREE SIGN}' + 'C'
+            wind_row[i].text = hour.wind
 
     def _add_bookings(self):
         self.document.add_heading('Bookings', 2)
-        bookings_table = self.document.add_table(rows=0, cols=2)
+        self._fill_bookings(self.document.add_table(rows=0, cols=2))
+
+    def _fill_bookings(self, bookings_table):
         for booking in self.bookings:
             row_cells = bookings_table.add_row().cells
             start = booking.start_at.strftime('%I:%M %p').strip('0')
@@ -0,0 +1,91 @@
+"""
+saving finished documents
+
+save() writes a document's .docx zip at a chosen compression level, either
+to a caller's buffer or to a file. A file is written to a temporary file in
+the same directory and renamed over the destination once it's complete, so
+a crash or a full disk part way through never leaves a truncated document.
+The new file keeps the mode of the document it replaces.
+
+compressing the parts is most of the time spent saving. python-docx always
+uses zlib's default level of 6, 1 saves about a third faster for a document
+about 40% larger, 0 stores the parts uncompressed, over twice as fast but
+many times larger, and 9 is slightly smaller and twice as slow. Set in
+config.json e.g.
+
+  "compression level": 1
+"""
+
+from typing import IO
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+import os
+
+from atomic import atomic_write
+from docx.document import Document
+from docx.opc.pkgwriter import PackageWriter
+
+
+# zlib's default, what python-docx saves with
+COMPRESSION_LEVEL = 6
+
+
+class _ZipWriter:
+    '''
+    the physical package writer python-docx's PackageWriter writes parts
+    to, with a compression level
+    '''
+
+    def __init__(self, file: IO[bytes], level: int):
+        self._zipf = ZipFile(file, 'w',
+                             compression=ZIP_DEFLATED if level else ZIP_STORED,
+                             compresslevel=level or None)
+
+    def write(self, pack_uri, blob: bytes):
+        self._zipf.writestr(pack_uri.membername, blob)
+
+    def close(self):
+        self._zipf.close()
+
+
+def serialize(document: Document, file: IO[bytes],
+              level: int = COMPRESSION_LEVEL):
+    '''
+    write document to file as Document.save does, at level, through
+    PackageWriter's internals, which is why requirements.txt pins python-docx
+    '''
+    package = document.part.package
+    parts = list(package.parts)
+    for part in parts:
+        part.before_marshal()
+    writer = _ZipWriter(file, level)
+    try:
+        PackageWriter._write_content_types_stream(writer, parts)
+        PackageWriter._write_pkg_rels(writer, package.rels)
+        PackageWriter._write_parts(writer, parts)
+    finally:
+        writer.close()
+
+
+def save(document: Document, destination: str | IO[bytes],
+         level: int = None):
+    '''
+    Save document to destination, a path or a writable binary buffer
+    level: zip compression level from 0 to 9, defaults to COMPRESSION_LEVEL
+    '''
+    level = COMPRESSION_LEVEL if level is None else level
+    if not 0 <= level <= 9:
+        raise ValueError(f'compression level {level} is not from 0 to 9')
+    if hasattr(destination, 'write'):
+        serialize(document, destination, level)
+        return
+
+    with atomic_write(destination, permissions=_mode(destination)) as f:
+        serialize(document, f, level)
+
+
+def _mode(path: str) -> int | None:
+    '''permissions of the file at path, None when there isn't one'''
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return None
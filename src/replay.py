@@ -0,0 +1,128 @@
+"""
+record and replay upstream responses
+
+while recording, every response the fetchers get from tides.gc.ca,
+WeatherAPI and TimeTree is also saved to a directory. Replaying serves the
+fetchers from that directory instead of the network, with today() pinned
+to the day the responses were recorded, so the whole pipeline runs offline
+and gives the same documents every time.
+
+    python3 main.py --record recordings/2023-06-14
+    python3 main.py --replay recordings/2023-06-14
+
+responses are keyed by source, the url's path and params, including any
+query in the url. The API key and the number of days asked for are left out
+of the key, so a recording can be replayed without credentials and for
+fewer days than were recorded. Request headers, including the TimeTree
+token, are never saved.
+"""
+
+from datetime import date
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+import hashlib
+import json
+import re
+import threading
+
+import requests
+
+from atomic import atomic_write
+import cache
+import timestamps
+
+
+INDEX = 'index.json'
+
+# params which don't change what a fetcher gets back, or are secret
+IGNORED_PARAMS = {'key', 'days', 'aqi', 'alerts'}
+
+
+class ReplayMissError(requests.ConnectionError):
+    '''raised when a request being replayed was never recorded'''
+
+
+class Recorder:
+
+    def __init__(self, directory: Path, mode: str = 'replay'):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f'unknown recorder mode {mode!r}')
+        self.directory = Path(directory)
+        self.mode = mode
+        self._lock = threading.Lock()
+        try:
+            self.index = json.loads((self.directory / INDEX).read_text())
+        except FileNotFoundError:
+            if mode == 'replay':
+                raise
+            self.index = {'recorded on': timestamps.today().isoformat(),
+                          'responses': {}}
+
+    @property
+    def recorded_on(self) -> date:
+        return date.fromisoformat(self.index['recorded on'])
+
+    def key(self, source: str, url: str, params: dict = None) -> str:
+        # a query in the url, like a next page link's, counts as params
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        kept = sorted((name, str(value))
+                      for name, value in [*query, *(params or {}).items()]
+                      if name not in IGNORED_PARAMS)
+        # the host is left out, so responses recorded from a stub server
+        # replay against the real upstream's url
+        path = re.sub('/+', '/', parts.path).rstrip('/')
+        raw = json.dumps([source, path, kept])
+        return f'{source}-{hashlib.sha256(raw.encode()).hexdigest()[:16]}'
+
+    def load(self, source: str, url: str,
+             params: dict = None) -> 'cache.CachedResponse':
+        key = self.key(source, url, params)
+        meta = self.index['responses'].get(key)
+        if meta is None:
+            raise ReplayMissError(f'no recorded {source} response for {url}')
+        body = (self.directory / f'{key}.body').read_bytes()
+        return cache.CachedResponse(meta['status_code'], body,
+                                    meta['headers'], from_cache=True)
+
+    def save(self, source: str, url: str, params: dict,
+             response: 'cache.CachedResponse'):
+        key = self.key(source, url, params)
+        kept = {name: value for name, value in (params or {}).items()
+                if name not in IGNORED_PARAMS}
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with atomic_write(self.directory / f'{key}.body') as f:
+                f.write(response.content)
+            self.index['responses'][key] = {
+                'source': source,
+                'url': url,
+                'params': kept,
+                'status_code': response.status_code,
+                'headers': response.headers,
+            }
+            with atomic_write(self.directory / INDEX, 'w') as f:
+                json.dump(self.index, f, indent=2)
+
+
+# the active recorder, None when fetching normally
+recorder: Recorder = None
+
+
+def start(directory: Path, mode: str = 'replay') -> Recorder:
+    '''
+    Record to or replay from directory until stop() is called.
+    Replaying pins today() to the day the responses were recorded
+    '''
+    global recorder
+    recorder = Recorder(directory, mode)
+    if mode == 'replay':
+        timestamps.pin(recorder.recorded_on)
+    return recorder
+
+
+def stop():
+    global recorder
+    if recorder is not None and recorder.mode == 'replay':
+        timestamps.pin(None)
+    recorder = None
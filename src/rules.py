@@ -0,0 +1,210 @@
+"""
+rule driven safety topics
+
+the day's hourly tide heights, temperatures, UV index and wind speeds are
+held in NumPy arrays, and every rule is evaluated as a vectorized mask over
+one of them. Rules are read from "safety rules" in config.json, e.g.
+
+  "safety rules": [
+    {"series": "wind", "op": ">=", "value": 25, "report": "runs",
+     "message": "Strong winds from {start} until {end}, stay in the harbour"}
+  ]
+
+series   temp (C), uv, wind (kph) or tide (m)
+op       one of <, <=, >, >=, ==
+report   any     one topic if any hour matches
+         span    one topic from the first to the last matching hour, if any
+                 matching hour is within "hours" (inclusive start and end)
+         runs    one topic per run of consecutive matching hours
+         windows tide only, one topic per stretch of the tide curve through
+                 the day's highs and lows, and those either side, which
+                 matches, to the minute, and overlaps "hours" when given.
+                 Reported like span when the day has no highs and lows
+message  may use {start} and {end}, formatted like '10 AM', or '10:24 AM'
+         for windows
+
+without "safety rules" the DEFAULT_RULES below are used.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+import json
+import operator
+import threading
+
+import numpy as np
+
+from config import RULE_OPS, RULE_REPORTS, RULE_SERIES
+from hourly import HourlySeries, TideSeries, WeatherSeries
+from tidecurve import TideCurve
+
+
+DEFAULT_RULES = [
+    {
+        'series': 'temp', 'op': '>=', 'value': 30, 'report': 'any',
+        'message': 'Watch out for Heat Exhaustion. Alternate staff working'
+                   ' in the sun, drink plenty of water',
+    },
+    {
+        'series': 'tide', 'op': '<=', 'value': 0.6, 'report': 'windows',
+        'hours': [9, 16],
+        'message': 'Tides too low to access channel behind Woods Island'
+                   ' from {start} to {end}',
+    },
+    {
+        'series': 'uv', 'op': '>=', 'value': 3, 'report': 'runs',
+        'message': 'Wear sunscreen. The UV-index is high today from {start}'
+                   ' until {end}',
+    },
+]
+
+_engines = {}
+_lock = threading.Lock()
+
+OPS = dict(zip(RULE_OPS, (operator.lt, operator.le, operator.gt,
+                          operator.ge, operator.eq)))
+
+
+@dataclass
+class Series:
+    '''one value per hour, missing values are NaN and never match a rule'''
+    times: Sequence[datetime]
+    hours: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_pairs(cls, pairs: list[tuple[datetime, float]]) -> 'Series':
+        times = [time for time, _ in pairs]
+        hours = np.fromiter((time.hour for time in times), dtype=np.int16,
+                            count=len(times))
+        values = np.fromiter((np.nan if value is None else value
+                              for _, value in pairs),
+                             dtype=np.float64, count=len(pairs))
+        return cls(times, hours, values)
+
+    @classmethod
+    def from_column(cls, series: HourlySeries, column: str) -> 'Series':
+        '''one column of an HourlySeries, without building its views'''
+        if not len(series):
+            return cls([], np.empty(0, np.int16), np.empty(0))
+        hours = (series.start.hour + np.arange(len(series), dtype=np.int16)) % 24
+        return cls(series.times, hours,
+                   np.asarray(series.columns[column], dtype=np.float64))
+
+
+def day_series(weather: list, hourly_tides: list,
+               high_and_low: list = (), neighbours: list = ()) -> dict:
+    '''
+    Arrays of a document's hourly weather and tides keyed by series name,
+    and the TideCurve through its highs and lows as 'tide curve'
+    neighbours: the highs and lows either side of the day, which carry the
+                curve from midnight to its first and from its last to
+                midnight. A day without highs and lows has no curve
+    '''
+    if isinstance(weather, WeatherSeries) and \
+            isinstance(hourly_tides, TideSeries):
+        series = {
+            'temp': Series.from_column(weather, 'temp'),
+            'uv': Series.from_column(weather, 'uv'),
+            'wind': Series.from_column(weather, 'wind_kph'),
+            'tide': Series.from_column(hourly_tides, 'meters'),
+        }
+    else:
+        series = {
+            'temp': Series.from_pairs([(hr.date, hr.temp) for hr in weather]),
+            'uv': Series.from_pairs([(hr.date, hr.uv) for hr in weather]),
+            'wind': Series.from_pairs([(hr.date, float(hr.wind.split()[-1]))
+                                       for hr in weather]),
+            'tide': Series.from_pairs([(tide.time, tide.meters)
+                                       for tide in hourly_tides]),
+        }
+    series['tide curve'] = TideCurve([*high_and_low, *neighbours]
+                                     if high_and_low else [])
+    return series
+
+
+class Rule:
+
+    def __init__(self, series: str, op: str, value: float, message: str,
+                 report: str = 'any', hours: list[int] = None):
+        if series not in RULE_SERIES:
+            raise ValueError(f'unknown safety rule series {series!r}')
+        if op not in OPS:
+            raise ValueError(f'unknown safety rule op {op!r}')
+        if report not in RULE_REPORTS:
+            raise ValueError(f'unknown safety rule report {report!r}')
+        if report == 'windows' and (series != 'tide' or op == '=='):
+            raise ValueError('windows are only reported for the tide '
+                             'being above or below a level')
+        self.series = series
+        self.compare = OPS[op]
+        self.value = value
+        self.message = message
+        self.report = report
+        self.hours = hours
+
+    def evaluate(self, series: Series, curve: TideCurve = None) -> list[str]:
+        if self.report == 'windows' and curve:
+            windows = curve.windows(self.value, self.compare in (operator.lt,
+                                                                 operator.le),
+                                    self.hours)
+            return [self.message.format(start=_clock(start), end=_clock(end))
+                    for start, end in windows]
+
+        # comparisons with NaN are always False
+        with np.errstate(invalid='ignore'):
+            mask = self.compare(series.values, self.value)
+        matches = np.flatnonzero(mask)
+        if not matches.size:
+            return []
+
+        if self.report == 'any':
+            return [self.message]
+
+        # windows without a tide curve are reported as a span of hours
+        if self.report in ('span', 'windows'):
+            if self.hours is not None:
+                start, end = self.hours
+                within = (series.hours[matches] >= start) & \
+                         (series.hours[matches] <= end)
+                if not within.any():
+                    return []
+            return [self._format(series, matches[0], matches[-1])]
+
+        # split wherever the next matching hour isn't the following hour
+        breaks = np.flatnonzero(np.diff(series.hours[matches]) != 1) + 1
+        return [self._format(series, run[0], run[-1])
+                for run in np.split(matches, breaks)]
+
+    def _format(self, series: Series, first: int, last: int) -> str:
+        return self.message.format(
+            start=series.times[first].strftime('%I %p').strip('0'),
+            end=series.times[last].strftime('%I %p').strip('0'))
+
+
+class RuleEngine:
+
+    def __init__(self, rules: list[dict] = None):
+        self.rules = [Rule(**rule) for rule in (rules or DEFAULT_RULES)]
+
+    def evaluate(self, series: dict) -> list[str]:
+        topics = []
+        for rule in self.rules:
+            topics.extend(rule.evaluate(series[rule.series],
+                                        series.get(f'{rule.series} curve')))
+        return topics
+
+
+def _clock(time: datetime) -> str:
+    return time.strftime('%I:%M %p').lstrip('0')
+
+
+def engine(rules: list[dict] = None) -> RuleEngine:
+    '''The RuleEngine for rules, only built once for each set of rules'''
+    # rules from the loaded config are read only mappings
+    key = json.dumps(rules, sort_keys=True, default=dict)
+    with _lock:
+        if key not in _engines:
+            _engines[key] = RuleEngine(rules)
+        return _engines[key]
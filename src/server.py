@@ -0,0 +1,256 @@
+"""
+HTTP API for on demand meeting documents
+
+    python3 main.py serve [--host 127.0.0.1] [--port 8080]
+
+GET /health
+GET /meetings/<day>.docx[?site=<name>]   the meeting document
+GET /meetings/<day>[?site=<name>]        its tides, weather, bookings and
+                                         safety topics as JSON
+day is YYYY-MM-DD or today, site is needed when config.json has "sites".
+
+each upstream is fetched for the whole coming week at once, as the daemon
+does, and held in memory for its cache time to live, so requests for any
+of the week's days share the same data. Concurrent requests for the same data or
+document wait on a single fetch or render rather than starting their own.
+A document is only rendered again once its inputs change. Changes to
+config.json are picked up by the next request.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+import asyncio
+import io
+import json
+import re
+import time
+
+from fetch import fetch_all
+from manifest import digest, json_default
+from mmg import MeetingDocumentGenerator, slice_day, upstream_sources
+from sites import Site, load_sites
+import cache
+import config
+import metrics
+import timestamps
+
+
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+MEETING = re.compile(r'/meetings/(today|\d{4}-\d{2}-\d{2})(\.docx)?')
+
+# seconds to wait for a client to send its request
+READ_TIMEOUT = 10
+
+# seconds between exports of the spans requests have recorded
+EXPORT_SECONDS = 60
+
+# meetings are served for this many days from today, the week the
+# upstreams cover
+DAYS = 7
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status: HTTPStatus, message: str = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class MeetingService:
+
+    def __init__(self, sites: list[Site], workers: int = 4):
+        self.sites = {site.name: site for site in sites}
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='serve')
+
+        # source name -> (monotonic time fetched, the today it was fetched
+        # on, data for the coming week)
+        self._data: dict[str, tuple] = {}
+
+        # (site name, day) -> (digest of the document's inputs, .docx bytes)
+        self._documents: dict[tuple, tuple] = {}
+
+        # key -> future of the fetch or render already under way
+        self._inflight: dict[tuple, asyncio.Future] = {}
+
+    def reconfigure(self):
+        '''pick up a changed config, documents are rendered again'''
+        self.sites = {site.name: site for site in load_sites()}
+        self._documents.clear()
+
+    def site(self, name: str = None) -> Site:
+        if name in self.sites:
+            return self.sites[name]
+        if None in self.sites:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'there is only one site')
+        if name is None:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f'site is one of {", ".join(self.sites)}')
+        raise HTTPError(HTTPStatus.NOT_FOUND, f'no site named {name}')
+
+    async def meeting(self, site: Site, day: date) -> MeetingDocumentGenerator:
+        '''The meeting for site on day, from data shared between requests'''
+        today = timestamps.today()
+        fetches = {src.name: self._source(src, today)
+                   for src in upstream_sources([site], today, DAYS)}
+        fetched = dict(zip(fetches, await asyncio.gather(*fetches.values())))
+        return MeetingDocumentGenerator(day, slice_day(fetched, day, site),
+                                        site)
+
+    async def _source(self, src, today: date) -> dict:
+        '''
+        a source's data for the week from today keyed by day, from memory
+        while younger than the source's cache time to live
+        '''
+        held = self._data.get(src.name)
+        ttl = cache.TTL[src.name.split(':')[0]]
+        if held and held[1] == today and time.monotonic() - held[0] < ttl:
+            return held[2]
+        data = await self._single_flight(('fetch', src.name, today),
+                                         lambda: fetch_all([src])[src.name])
+
+        # a failed fetch isn't kept, so the next request tries again
+        if today in data:
+            self._data[src.name] = (time.monotonic(), today, data)
+            self._forget_before(today)
+        return data
+
+    async def document(self, site: Site, day: date) -> bytes:
+        meeting_doc = await self.meeting(site, day)
+        inputs = digest(meeting_doc.section_hashes(
+            config.CONFIG.template))
+        cached = self._documents.get((site.name, day))
+        if cached and cached[0] == inputs:
+            return cached[1]
+        content = await self._single_flight(('render', site.name, day, inputs),
+                                            self._render, meeting_doc)
+        self._documents[(site.name, day)] = (inputs, content)
+        return content
+
+    async def _single_flight(self, key: tuple, func, *args):
+        '''run func in a worker thread, unless it's already running for key'''
+        if key not in self._inflight:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, func, *args)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(self._inflight[key])
+
+    def _render(self, meeting_doc: MeetingDocumentGenerator) -> bytes:
+        meeting_doc.generate_from_template(config.CONFIG.template)
+        buffer = io.BytesIO()
+        meeting_doc.write_to_file(buffer)
+        return buffer.getvalue()
+
+    def _forget_before(self, day: date):
+        for key in [key for key in self._documents if key[1] < day]:
+            self._documents.pop(key, None)
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, target = await asyncio.wait_for(
+                    read_request(reader), READ_TIMEOUT)
+                if method != 'GET':
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+                if config.reload():
+                    self.reconfigure()
+                status, content_type, body = await self.route(target)
+            except HTTPError as error:
+                status, content_type = error.status, 'application/json'
+                body = json.dumps({'error': str(error)}).encode()
+            except (asyncio.TimeoutError, ValueError):
+                status, content_type = HTTPStatus.BAD_REQUEST, 'application/json'
+                body = json.dumps({'error': 'bad request'}).encode()
+            except Exception as error:
+                print(f'ERROR: Unable to handle request ({error!r})')
+                status, content_type = (HTTPStatus.INTERNAL_SERVER_ERROR,
+                                        'application/json')
+                body = json.dumps({'error': 'internal server error'}).encode()
+            writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                         f'Content-Type: {content_type}\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         'Connection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def export_metrics(self) -> bool:
+        '''
+        Export the spans recorded since the last export, once an upstream
+        has been fetched. Until then they're held, so the Prometheus textfile
+        always has the latest fetches rather than only requests answered
+        from memory. Spans are only recorded once they finish, so a request
+        still under way is exported with the next fetch
+        Returns whether they were exported
+        '''
+        if not any(span.name == 'upstream' for span in metrics.recorder.spans):
+            return False
+        metrics.export(config.CONFIG.metrics)
+        return True
+
+    async def route(self, target: str) -> tuple:
+        url = urlsplit(target)
+        path = unquote(url.path)
+        if path == '/health':
+            return HTTPStatus.OK, 'application/json', b'{"status": "ok"}'
+        match = MEETING.fullmatch(path)
+        if not match:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+
+        day = timestamps.today() if match[1] == 'today' \
+            else date.fromisoformat(match[1])
+        if not 0 <= (day - timestamps.today()).days < DAYS:
+            raise HTTPError(HTTPStatus.NOT_FOUND,
+                            'meetings are available for the coming week')
+        site = self.site(parse_qs(url.query).get('site', [None])[0])
+
+        if match[2]:
+            return HTTPStatus.OK, DOCX, await self.document(site, day)
+        meeting_doc = await self.meeting(site, day)
+        return HTTPStatus.OK, 'application/json', json.dumps({
+            'day': day,
+            'site': site.name,
+            'tides': meeting_doc.tides,
+            'weather': meeting_doc.weather,
+            'bookings': meeting_doc.bookings,
+            'safety topics': meeting_doc.safety_topics.topics,
+        }, default=json_default).encode()
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str]:
+    '''the method and target of a request, its headers are discarded'''
+    method, target, _ = (await reader.readline()).decode('latin-1').split()
+    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+        pass
+    return method, target
+
+
+async def serve(service: MeetingService, host: str = '127.0.0.1',
+                port: int = 8080):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f'serving meeting documents on http://{host}:{port}')
+    exporter = asyncio.create_task(export_metrics(service))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        exporter.cancel()
+
+
+async def export_metrics(service: MeetingService,
+                         interval: float = EXPORT_SECONDS):
+    '''export the service's spans every interval, as the daemon does per run'''
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(service.executor,
+                                       service.export_metrics)
+        except OSError as error:
+            print(f'ERROR: Unable to export metrics ({error!r})')
@@ -0,0 +1,73 @@
+"""
+launch sites which meeting documents are generated for
+
+sites are listed in config.json under "sites", any property a site leaves
+out is taken from the top level of the config. e.g.
+
+  "sites": [
+    {"name": "ladysmith", "location": "ladysmith", "tide station": "7460",
+     "forecast hours": [9, 17]},
+    {"name": "chemainus", "location": "chemainus", "tide station": "7455",
+     "calendar ID": "ANOTHER_TIMETREE_CALENDAR_ID"}
+  ]
+
+without a "sites" list the top level config describes the only site.
+"forecast hours" are the first and last hour of the weather table, sites
+sharing a location share one forecast request whatever their hours.
+"""
+
+from dataclasses import dataclass
+
+import config
+
+
+DEFAULT_LOCATION = 'ladysmith'
+DEFAULT_STATION = '7460'
+DEFAULT_FORECAST_HOURS = (10, 18)
+
+
+@dataclass(frozen=True)
+class Site:
+    # included in the document's file name, None for the only site
+    name: str
+    location: str
+    station: str
+    calendar_id: str
+    output_location: str
+    employees: tuple[str, ...]
+
+    # first and last hour of the weather table
+    forecast_hours: tuple[int, int] = DEFAULT_FORECAST_HOURS
+
+    @property
+    def file_prefix(self) -> str:
+        if self.name is None:
+            return 'morning_meeting_'
+        return f'morning_meeting_{self.name}_'
+
+
+def load_sites() -> list[Site]:
+    '''Create a Site for each site in the loaded config'''
+    raw_sites = config.CONFIG.sites
+    if not raw_sites:
+        return [site_from_config(config.CONFIG, None)]
+    return [site_from_config({**config.CONFIG, **raw}, raw['name'])
+            for raw in raw_sites]
+
+
+def default_site() -> Site:
+    '''The site described by the top level of the loaded config'''
+    return site_from_config(config.CONFIG, None)
+
+
+def site_from_config(raw: dict, name: str) -> Site:
+    return Site(
+        name=name,
+        location=raw.get('location', DEFAULT_LOCATION),
+        station=str(raw.get('tide station', DEFAULT_STATION)),
+        calendar_id=raw['calendar ID'],
+        output_location=raw['output location'],
+        employees=tuple(raw['employees']),
+        forecast_hours=tuple(raw.get('forecast hours',
+                                     DEFAULT_FORECAST_HOURS)),
+    )
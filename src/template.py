@@ -0,0 +1,113 @@
+"""
+prebuilt base document for the meeting documents
+
+the template holds everything that's the same every day, the headings,
+the 'General Notes' space and the tides, weather and bookings tables, with
+marker paragraphs where the day's text goes. It's built or loaded from disk
+once per process and every document starts as an in-memory copy of it.
+
+to restyle the documents, save the default template with
+    python -m template template.docx
+edit it in Word, keeping the markers and the order of the tables, and set
+"template" in config.json to its path.
+"""
+
+import copy
+import sys
+import threading
+
+from docx import Document
+from docx.document import Document as DocumentObject
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+
+DATE = '{date}'
+ATTENDANTS = '{attendants}'
+SAFETY_TOPICS = '{safety topics}'
+MARKERS = (DATE, ATTENDANTS, SAFETY_TOPICS)
+
+# hours 10 to 18, columns are added or removed to fit the forecast
+WEATHER_COLUMNS = 9
+
+_templates: dict[str, DocumentObject] = {}
+_lock = threading.Lock()
+
+
+def build() -> DocumentObject:
+    '''Build the default template'''
+    document = Document()
+    document.add_heading('Daily Safety Meeting', 0)
+    document.add_paragraph(DATE)
+    document.add_heading('Attendants', 2)
+    document.add_paragraph(ATTENDANTS)
+    document.add_heading('Safety Topic', 2)
+    document.add_paragraph(SAFETY_TOPICS)
+    document.add_heading('General Notes/Maintenance', 2)
+
+    #  Leave white space for employees to write in
+    document.add_paragraph('\n' * 2)
+
+    document.add_heading('Tides', 2)
+    document.add_table(rows=2, cols=4)
+    document.add_heading('Weather', 2)
+    document.add_table(rows=4, cols=WEATHER_COLUMNS)
+    document.add_heading('Bookings', 2)
+    document.add_table(rows=0, cols=2)
+    return document
+
+
+def load(path: str = None) -> DocumentObject:
+    '''
+    The parsed template at path, or the default template when path is None
+    Only built or read once per process, don't modify the returned document
+    '''
+    with _lock:
+        if path not in _templates:
+            _templates[path] = build() if path is None else Document(path)
+        return _templates[path]
+
+
+def new_document(path: str = None) -> DocumentObject:
+    '''A copy of the template, ready to be filled'''
+
+    # copy the whole package, lxml elements don't share a deepcopy memo so
+    # copying the Document itself would leave it with a detached body
+    package = copy.deepcopy(load(path).part.package)
+    return package.main_document_part.document
+
+
+def markers(document: DocumentObject) -> dict[str, Paragraph]:
+    '''Find the marker paragraphs in a copy of the template'''
+    found = {}
+    for paragraph in document.paragraphs:
+        if paragraph.text.strip() in MARKERS:
+            found[paragraph.text.strip()] = paragraph
+    missing = set(MARKERS) - set(found)
+    if missing:
+        raise ValueError(f'template is missing {", ".join(sorted(missing))}')
+    return found
+
+
+def fit_columns(table: Table, count: int):
+    '''
+    Add or remove columns at the end of table so it has count columns,
+    sharing the table's width equally
+    '''
+    tbl = table._tbl
+    width = sum(column.width or 0 for column in table.columns)
+    while len(tbl.tblGrid.gridCol_lst) > count:
+        tbl.tblGrid.remove(tbl.tblGrid.gridCol_lst[-1])
+        for tr in tbl.tr_lst:
+            tr.remove(tr.tc_lst[-1])
+    while len(tbl.tblGrid.gridCol_lst) < count:
+        table.add_column(width // count)
+    for column in table.columns:
+        column.width = width // count
+    for row in table.rows:
+        for cell in row.cells:
+            cell.width = width // count
+
+
+if __name__ == '__main__':
+    build().save(sys.argv[1] if len(sys.argv) > 1 else 'template.docx')
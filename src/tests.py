@@ -1,101 +1,89 @@
+import asyncio
 import unittest
 import json
+import os
 import requests
-from datetime import datetime
+import tempfile
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from pathlib import Path
 from pytz import timezone
 
+import archive
+import cache
 import config as config
+import fixtures
 from Booking import get_bookings
-from SafetyTopics import split_hours
+from SafetyTopics import SafetyTopics, split_hours
 from Weather import *
+from benchmarks import stubs
+from benchmarks.stubs import StubServer
+from cache import ResponseCache
+from fetch import Source, fetch_all
+from hourly import Forecast, HourlySeries, TideSeries, WeatherSeries
+from icons import IconStore
+from manifest import Manifest
+from sites import Site, load_sites
+from tidecurve import TideCurve
+import daemon
+import manifest
+import metrics
+import mmg
+import output
+import replay
+import server
+import upstream
+import Booking as booking_api
 import Tide
+import Weather as weather_api
+import rules
+import timestamps
+
+
+def setUpModule():
+    # documents read their safety rules and compression level from the config
+    config.CONFIG = fixtures.load_config()
+
+
+def tearDownModule():
+    config.CONFIG = None
 
 
 class TestGetBookings(unittest.TestCase):
+    '''against a recording of the TimeTree fixture'''
 
     def setUp(self):
-        config.load()
-        self.token = config.CONFIG['personal access token']
-        self.base_url = 'https://timetreeapis.com/' 
+        self.dir = tempfile.TemporaryDirectory()
+        self.saved_config = config.CONFIG
+        config.CONFIG = fixtures.load_config()
+        replay.start(fixtures.record(self.dir.name))
         self.cal_id = 'hDxoVNUBhrPi'
-        self.headers = {'accept': 'application/vnd.timetree.v1_json',
-                       'Authorization': f'Bearer {self.token}'}
-
-        self.now = datetime.now(timezone('America/Vancouver')) \
-            .replace(microsecond=0)
-
-        self.midnight = datetime.now() \
-            .replace(hour=0, minute=0, second=0, microsecond=0)
-        self.midnight = self.midnight.replace(tzinfo=timezone('UTC'))
-        utc = timezone('UTC')
-
-        data = list()
-        self.booking_id = list()
-
-        data.append({
-            'data': {
-                'attributes': {
-                    'title': 'test booking 0',
-                    'category': 'schedule',
-                    'all_day': True,
-                    'start_at': self.midnight.isoformat(),
-                    'end_at': self.midnight.isoformat()
-                },
-                'relationships': {
-                    'label': {
-                        'data': {
-                            'id': '1',
-                            'type': 'label'
-                        }
-                    }
-                }
-            }
-        })
-        data.append({
-            'data': {
-                'attributes': {
-                    'title': 'test booking 1',
-                    'category': 'schedule',
-                    'all_day': False,
-                    'start_at': self.now.astimezone(utc).isoformat(),
-                    'end_at': self.now.astimezone(utc).isoformat()
-                },
-                'relationships': {
-                    'label': {
-                        'data': {
-                            'id': '1',
-                            'type': 'label'
-                        }
-                    }
-                }
-            }
-        })
-        for raw_booking in data:
-            res = requests.post(
-                f'{self.base_url}/calendars/{self.cal_id}/events',
-                headers=self.headers, json=raw_booking)
-            self.booking_id.append(json.loads(res.text)['data']['id'])
-    
+        self.midnight = datetime(2023, 6, 14, tzinfo=timezone('UTC'))
+
     def tearDown(self):
-        for id in self.booking_id:
-            requests.delete(
-                f'{self.base_url}/calendars/{self.cal_id}/events/{id}',
-                headers=self.headers)
+        replay.stop()
+        config.CONFIG = self.saved_config
+        self.dir.cleanup()
 
     def test_get_full_day_booking(self):
         booking = get_bookings(self.cal_id)[0]
-        self.assertEqual(booking.title, 'test booking 0')
+        self.assertEqual(booking.title, 'Staff day 14')
         self.assertEqual(booking.all_day, True)
         self.assertEqual(booking.start_at.isoformat(), self.midnight.isoformat())
         self.assertEqual(booking.end_at.isoformat(), self.midnight.isoformat())
 
-    
     def test_get_partial_day_booking(self):
         booking = get_bookings(self.cal_id)[1]
-        self.assertEqual(booking.title, 'test booking 1')
+        self.assertEqual(booking.title, 'Family tour (4)')
         self.assertEqual(booking.all_day, False)
-        self.assertEqual(booking.start_at.isoformat(), self.now.isoformat())
-        self.assertEqual(booking.end_at.isoformat(), self.now.isoformat())
+        self.assertEqual(booking.start_at.isoformat(), '2023-06-14T09:00:00-07:00')
+        self.assertEqual(booking.end_at.isoformat(), '2023-06-14T11:30:00-07:00')
+
+    def test_only_todays_bookings(self):
+        bookings = get_bookings(self.cal_id)
+        self.assertEqual(len(bookings), 4)
+        self.assertTrue(all(booking.start_at.date() == date(2023, 6, 14)
+                            for booking in bookings))
 
 
 class TestSplitHours(unittest.TestCase):
@@ -122,6 +110,1198 @@ class TestSplitHours(unittest.TestCase):
         self.assertEqual(split_hours(self.weather), [self.wx1, self.wx2, self.wx3])
 
 
+class TestFetchAll(unittest.TestCase):
+
+    def test_sources_run_concurrently(self):
+        start = time.monotonic()
+        results = fetch_all([
+            Source('a', lambda: time.sleep(0.2) or 'a'),
+            Source('b', lambda: time.sleep(0.2) or 'b'),
+        ])
+        self.assertEqual(results, {'a': 'a', 'b': 'b'})
+        self.assertLess(time.monotonic() - start, 0.35)
+
+    def test_failing_source_is_isolated(self):
+        def broken():
+            raise KeyError('data')
+
+        results = fetch_all([
+            Source('slow', lambda: time.sleep(1), timeout=0.1),
+            Source('broken', broken, default=dict),
+            Source('ok', lambda: [1, 2, 3]),
+        ])
+        self.assertEqual(results, {'slow': [], 'broken': {}, 'ok': [1, 2, 3]})
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_fresh_response_served_from_disk(self):
+        with StubServer(b'{"a": 1}', 'application/json') as server:
+            first = self.cache.get(server.url, {'q': 'x'}, ttl=60)
+            second = self.cache.get(server.url, {'q': 'x'}, ttl=60)
+            self.assertEqual(server.requests, 1)
+        self.assertFalse(first.from_cache)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.json(), {'a': 1})
+
+    def test_expired_response_revalidated(self):
+        with StubServer(b'tides', 'text/html', etag='"v1"') as server:
+            self.cache.get(server.url, ttl=0)
+            server.payload = b'changed'
+            res = self.cache.get(server.url, ttl=0)
+            self.assertEqual(server.requests, 2)
+        self.assertTrue(res.from_cache)
+        self.assertEqual(res.content, b'tides')
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 12
+        with StubServer(b'123456', 'text/plain') as server:
+            for path in ('/a', '/b', '/a', '/c'):
+                self.cache.get(server.url + path, ttl=60)
+                time.sleep(0.01)
+            self.assertEqual(server.requests, 3)
+
+            # /b was the least recently used when /c pushed the cache over
+            self.cache.get(server.url + '/a', ttl=60)
+            self.assertEqual(server.requests, 3)
+            self.cache.get(server.url + '/b', ttl=60)
+            self.assertEqual(server.requests, 4)
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_matches_dateparser(self):
+        import dateparser
+        samples = [
+            (timestamps.parse_clock, '03:43'),
+            (timestamps.parse_clock, '3:43 PM'),
+            (timestamps.parse_iso, '2023-06-14 10:00'),
+            (timestamps.parse_iso, '2023-06-14T16:00:00.000Z'),
+        ]
+        for parse, text in samples:
+            expected = dateparser.parse(text)
+            actual = parse(text)
+            self.assertEqual(actual.isoformat(), expected.isoformat(), text)
+        self.assertEqual(timestamps.midnight(),
+                         dateparser.parse('midnight today'))
+
+    def test_unknown_format_falls_back(self):
+        self.assertEqual(timestamps.parse_clock('June 14 2023 3pm'),
+                         datetime(2023, 6, 14, 15))
+
+
+class TestParseTidePage(unittest.TestCase):
+
+    def setUp(self):
+        self.page = fixtures.load('tides_7460.html', date.today())
+        self.day_table_id = date.today().strftime('day-table-%Y-%m-%d')
+
+    def chunks(self):
+        for i in range(0, len(self.page), 1024):
+            self.read = i + 1024
+            yield self.page[i:i + 1024]
+
+    def test_high_and_low_tides(self):
+        tables = Tide.parse_tide_page(self.chunks(), [self.day_table_id])
+        tides = Tide.parse_high_and_low_tides(tables[self.day_table_id])
+        self.assertEqual([str(tide) for tide in tides],
+            ['4.1m @ 2:40 AM', '-0.1m @ 9:19 AM', '4.4m @ 4:07 PM',
+             '1.7m @ 9:57 PM'])
+        self.assertEqual(tides[1].feet, -0.3)
+
+    def test_hourly_tides(self):
+        tables = Tide.parse_tide_page(self.chunks(), [Tide.HOURLY_TABLE_ID])
+        tides = Tide.parse_hourly_tides(tables[Tide.HOURLY_TABLE_ID])
+        self.assertEqual(len(tides), 24)
+        self.assertEqual(tides[9].time, datetime.combine(date.today(),
+                                                         datetime.min.time())
+                         .replace(hour=9))
+        self.assertEqual(tides[9].meters, -0.1)
+        self.assertEqual(tides[9].feet, '-0.3')
+
+        rows = tables[Tide.HOURLY_TABLE_ID]
+        with self.assertRaises(ValueError):
+            Tide.parse_hourly_tides(rows, date.today() - timedelta(days=1))
+        with self.assertRaises(ValueError):
+            Tide.parse_hourly_tides(rows, date.today() +
+                                    timedelta(days=len(rows)))
+
+    def test_tide_range_neighbours(self):
+        today = date.today()
+        response = cache.CachedResponse(200, self.page, {})
+        tides = Tide.parse_tide_range(response, today, 7)
+        self.assertEqual(sorted(tides), [today + timedelta(days=i)
+                                         for i in range(7)])
+        # the page starts today and ends a week later
+        self.assertEqual(tides[today]['neighbours'],
+                         tides[today + timedelta(days=1)]['high and low'][:1])
+        middle = tides[today + timedelta(days=3)]['neighbours']
+        self.assertEqual(middle, [
+            tides[today + timedelta(days=2)]['high and low'][-1],
+            tides[today + timedelta(days=4)]['high and low'][0]])
+        self.assertEqual(len(tides[today + timedelta(days=6)]['neighbours']), 1)
+
+    def test_stops_reading_once_tables_found(self):
+        Tide.parse_tide_page(self.chunks(),
+                             [self.day_table_id, Tide.HOURLY_TABLE_ID])
+        self.assertLess(self.read, len(self.page))
+
+    def test_missing_table_left_out(self):
+        tables = Tide.parse_tide_page(self.chunks(), ['day-table-1999-01-01'])
+        self.assertEqual(tables, {})
+        self.assertGreaterEqual(self.read, len(self.page))
+
+
+class TestTideCurve(unittest.TestCase):
+
+    def setUp(self):
+        self.tides = fixtures.meeting_data()['tides']
+        self.curve = TideCurve(self.tides['high and low'])
+
+    def test_follows_hourly_heights(self):
+        for tide in self.tides['hourly']:
+            height = self.curve.height(tide.time)
+            if height == height:
+                self.assertAlmostEqual(height, tide.meters, delta=0.1)
+        # before the first high or low and after the last
+        for hour in (0, 23):
+            height = self.curve.height(timestamps.midnight().replace(hour=hour))
+            self.assertNotEqual(height, height)
+
+    def test_windows(self):
+        midnight = timestamps.midnight()
+        self.assertEqual(self.curve.windows(0.6), [
+            (midnight.replace(hour=7, minute=32, second=11),
+             midnight.replace(hour=11, minute=4, second=18))])
+        self.assertEqual(self.curve.windows(0.6, hours=(12, 16)), [])
+        self.assertEqual(self.curve.windows(4.2, below=False), [
+            (midnight.replace(hour=15, minute=11, second=50),
+             midnight.replace(hour=17, minute=8, second=25))])
+
+    def test_across_days(self):
+        day = date.today()
+        shifted = [Tide.Tide(tide.time + timedelta(days=1), tide.meters, None)
+                   for tide in self.tides['high and low']]
+        curve = TideCurve.from_days({
+            day + timedelta(days=1): {'high and low': shifted},
+            day: self.tides})
+        self.assertEqual(len(curve), 8)
+        self.assertEqual([start.date() for start, _ in curve.windows(0.6)],
+                         [day, day + timedelta(days=1)])
+        self.assertFalse(TideCurve([]))
+        self.assertEqual(TideCurve([]).windows(0.6), [])
+
+
+class TestForecast(unittest.TestCase):
+
+    def setUp(self):
+        self.days = json.loads(fixtures.load('weather_forecast.json',
+                                             date.today()))['forecast']['forecastday']
+        self.forecast = Forecast.from_api_days(self.days)
+        self.today = date.today()
+
+    def test_windows(self):
+        tomorrow = self.today + timedelta(days=1)
+        self.assertEqual(list(self.forecast),
+                         [self.today + timedelta(days=i) for i in range(3)])
+        self.assertEqual(self.forecast.window(self.today, 10, 18),
+                         WeatherSeries.from_api_hours(self.days[0]['hour'][10:19]))
+        self.assertEqual(self.forecast.window(tomorrow, 6, 8),
+                         WeatherSeries.from_api_hours(self.days[1]['hour'][6:9]))
+        self.assertEqual(len(self.forecast[tomorrow]), 24)
+        self.assertNotIn(self.today + timedelta(days=3), self.forecast)
+        with self.assertRaises(KeyError):
+            self.forecast.window(self.today - timedelta(days=1))
+
+    def test_sites_share_one_request(self):
+        dir = tempfile.TemporaryDirectory()
+        saved = cache.cache, config.CONFIG, weather_api.URL
+        cache.cache = ResponseCache(dir.name)
+        config.CONFIG = fixtures.load_config()
+        sites = [Site('a', 'ladysmith', '7460', 'a', '', (), (10, 18)),
+                 Site('b', 'ladysmith', '7460', 'a', '', (), (7, 11))]
+        try:
+            with stubs.weather_server() as weather:
+                weather_api.URL = weather.url
+                sources = [src for src in mmg.upstream_sources(sites, None, 2)
+                           if src.name.startswith('weather:')]
+                data = {**fetch_all(sources), 'tides:7460': {}, 'bookings:a': {}}
+            self.assertEqual(weather.requests, 1)
+        finally:
+            cache.cache, config.CONFIG, weather_api.URL = saved
+            dir.cleanup()
+        tomorrow = self.today + timedelta(days=1)
+        self.assertEqual(len(mmg.slice_day(data, tomorrow, sites[0])['weather']), 9)
+        weather = mmg.slice_day(data, tomorrow, sites[1])['weather']
+        self.assertEqual([hour.date.hour for hour in weather], [7, 8, 9, 10, 11])
+
+
+class TestHourlySeries(unittest.TestCase):
+
+    def setUp(self):
+        forecast = json.loads(fixtures.load('weather_forecast.json'))
+        self.hours = forecast['forecast']['forecastday'][0]['hour'][10:19]
+
+    def test_weather_views_match_parsed_hours(self):
+        series = WeatherSeries.from_api_hours(self.hours)
+        self.assertEqual(len(series), 9)
+        self.assertEqual(list(series),
+                         [parse_api_hour(hour) for hour in self.hours])
+        self.assertEqual(series[-1], parse_api_hour(self.hours[-1]))
+        self.assertEqual(series[2:5],
+                         [parse_api_hour(hour) for hour in self.hours[2:5]])
+        self.assertEqual(series[2:5].start, series[2].date)
+
+    def test_blank_tides(self):
+        tides = TideSeries(datetime(2023, 6, 14))
+        tides.append(None)
+        tides.append(1.25)
+        self.assertEqual(tides[0], Tide.Tide(datetime(2023, 6, 14), None, None))
+        self.assertEqual(tides[1].feet, '4.1')
+        self.assertFalse(tides[0].is_too_low_for_woods())
+
+    def test_subclass_needs_view(self):
+        class Incomplete(HourlySeries):
+            COLUMNS = {'meters': 'd'}
+        with self.assertRaises(TypeError):
+            Incomplete(datetime(2023, 6, 14))
+
+    def test_pickles(self):
+        import pickle
+        series = WeatherSeries.from_api_hours(self.hours)
+        self.assertEqual(pickle.loads(pickle.dumps(series)), series)
+
+    def test_rule_series_match_lists(self):
+        data = fixtures.meeting_data()
+        columns = rules.day_series(data['weather'], data['tides']['hourly'])
+        lists = rules.day_series(list(data['weather']),
+                                 list(data['tides']['hourly']))
+        for name in ('temp', 'uv', 'wind', 'tide'):
+            series = columns[name]
+            self.assertEqual(list(series.times), lists[name].times)
+            self.assertEqual(series.values.tolist(),
+                             lists[name].values.tolist())
+
+
+class TestBookingIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.events = json.loads(fixtures.load(
+            'timetree_upcoming_events.json'))['data']
+
+    def test_only_the_days_asked_for(self):
+        index = booking_api.BookingIndex()
+        index.add(self.events, date(2023, 6, 15), 2)
+        self.assertEqual(list(index), [date(2023, 6, 15), date(2023, 6, 16)])
+        parsed = [booking_api.create_booking_obj(raw) for raw in self.events]
+        self.assertEqual(index[date(2023, 6, 16)],
+                         [booking for booking in parsed
+                          if booking.start_at.date() == date(2023, 6, 16)])
+        self.assertNotIn(date(2023, 6, 14), index)
+
+    def test_built_when_looked_up(self):
+        index = booking_api.BookingIndex()
+        index.add(self.events, date(2023, 6, 14), 7)
+        self.assertIn(date(2023, 6, 20), index)
+        self.assertFalse(index._built)
+        self.assertIsInstance(index[date(2023, 6, 20)][0], booking_api.Booking)
+        self.assertEqual(index._built, {date(2023, 6, 20)})
+
+    def test_bounded(self):
+        index = booking_api.BookingIndex(max_days=3)
+        index.add(self.events, date(2023, 6, 14), 7)
+        self.assertEqual(list(index), [date(2023, 6, 18), date(2023, 6, 19),
+                                       date(2023, 6, 20)])
+
+    def test_follows_next_links(self):
+        dir = tempfile.TemporaryDirectory()
+        saved = cache.cache, config.CONFIG, booking_api.BASE_URL
+        cache.cache = ResponseCache(dir.name)
+        config.CONFIG = fixtures.load_config()
+        timestamps.pin(fixtures.FIXTURE_DATE)
+        try:
+            with StubServer(json.dumps({'data': self.events[4:]}).encode(),
+                            'application/vnd.timetree.v1+json') as second:
+                first = json.dumps({'data': self.events[:4], 'links': {
+                    'next': second.url + '/upcoming_events?page=2'}})
+                with StubServer(first.encode(),
+                                'application/vnd.timetree.v1+json') as server:
+                    booking_api.BASE_URL = server.url
+                    bookings = booking_api.get_bookings_range(
+                        'a', fixtures.FIXTURE_DATE, 7)
+                self.assertEqual(second.requests, 1)
+        finally:
+            cache.cache, config.CONFIG, booking_api.BASE_URL = saved
+            timestamps.pin()
+            dir.cleanup()
+        self.assertEqual(len(bookings), 7)
+        self.assertEqual(sum(len(day) for day in bookings.values()), 28)
+
+    def test_records_and_replays_every_page(self):
+        dir = tempfile.TemporaryDirectory()
+        saved = cache.cache, config.CONFIG, booking_api.BASE_URL
+        cache.cache = ResponseCache(dir.name + '/cache')
+        config.CONFIG = fixtures.load_config()
+        timestamps.pin(fixtures.FIXTURE_DATE)
+        content_type = 'application/vnd.timetree.v1+json'
+        path = '/calendars/a/upcoming_events'
+        try:
+            with StubServer(json.dumps({'data': self.events[12:]}).encode(),
+                            content_type) as third:
+                second = json.dumps({'data': self.events[4:12], 'links': {
+                    'next': f'{third.url}{path}?page=3'}})
+                with StubServer(second.encode(), content_type) as second:
+                    first = json.dumps({'data': self.events[:4], 'links': {
+                        'next': f'{second.url}{path}?page=2'}})
+                    with StubServer(first.encode(), content_type) as server:
+                        booking_api.BASE_URL = server.url
+                        replay.start(dir.name + '/recording', 'record')
+                        recorded = booking_api.get_bookings_range(
+                            'a', fixtures.FIXTURE_DATE, 7)
+                        replay.stop()
+
+            replay.start(dir.name + '/recording')
+            replayed = booking_api.get_bookings_range(
+                'a', fixtures.FIXTURE_DATE, 7)
+        finally:
+            replay.stop()
+            cache.cache, config.CONFIG, booking_api.BASE_URL = saved
+            timestamps.pin()
+            dir.cleanup()
+        self.assertEqual(sum(len(day) for day in recorded.values()), 28)
+        self.assertEqual(dict(replayed), dict(recorded))
+
+    def test_requested_days_clamped(self):
+        from unittest import mock
+        saved = config.CONFIG
+        config.CONFIG = fixtures.load_config()
+        timestamps.pin(fixtures.FIXTURE_DATE)
+        response = mock.Mock(**{'json.return_value': {'data': []}})
+        try:
+            with mock.patch.object(cache, 'get',
+                                   return_value=response) as get:
+                for start, days in ((1, 7), (-3, 1), (0, 3)):
+                    booking_api.get_bookings_range(
+                        'a', fixtures.FIXTURE_DATE + timedelta(days=start),
+                        days)
+        finally:
+            config.CONFIG = saved
+            timestamps.pin()
+        self.assertEqual([call.kwargs['params']['days']
+                          for call in get.call_args_list], [7, 1, 3])
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.saved = cache.cache
+        cache.cache = ResponseCache(self.dir.name + '/cache')
+        self.fixtures = fixtures.record(self.dir.name + '/fixtures')
+
+    def tearDown(self):
+        replay.stop()
+        cache.cache = self.saved
+        self.dir.cleanup()
+
+    def test_record_then_replay(self):
+        recording = self.dir.name + '/recording'
+        with StubServer(b'{"data": []}', 'application/json') as server:
+            replay.start(recording, 'record')
+            cache.get('bookings', server.url + '/calendars/a/upcoming_events',
+                      params={'days': 1}, headers={'Authorization': 'secret'})
+            replay.stop()
+
+            replay.start(recording)
+            res = cache.get('bookings',
+                            'https://timetreeapis.com//calendars/a/upcoming_events',
+                            params={'days': 7})
+            self.assertEqual(res.json(), {'data': []})
+            self.assertEqual(server.requests, 1)
+            self.assertEqual(timestamps.today(), date.today())
+        for path in Path(recording).iterdir():
+            self.assertNotIn(b'secret', path.read_bytes())
+
+    def test_unrecorded_request(self):
+        replay.start(self.fixtures)
+        with self.assertRaises(replay.ReplayMissError):
+            cache.get('bookings', 'https://timetreeapis.com/calendars/b/upcoming_events')
+
+    def test_replays_pipeline_offline(self):
+        replay.start(self.fixtures)
+        self.assertEqual(timestamps.today(), fixtures.FIXTURE_DATE)
+        saved = config.CONFIG
+        config.CONFIG = fixtures.load_config()
+        try:
+            site = Site(None, 'ladysmith', '7460', 'hDxoVNUBhrPi',
+                        self.dir.name + '/', ('A',))
+            data = fetch_all(mmg.upstream_sources([site], None, 3))
+        finally:
+            config.CONFIG = saved
+        day = date(2023, 6, 15)
+        meeting_doc = mmg.MeetingDocumentGenerator(
+            day, mmg.slice_day(data, day, site), site)
+        self.assertEqual(meeting_doc.tides['high and low'][0].time.date(), day)
+        self.assertEqual(len(meeting_doc.weather), 9)
+        self.assertEqual(meeting_doc.bookings[0].title, 'Staff day 15')
+        self.assertIn('Tides too low to access channel behind Woods Island '
+                      'from 8:22 AM to 11:54 AM', meeting_doc.safety_topics.topics)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.saved = cache.cache
+        cache.cache = ResponseCache(self.dir.name + '/cache')
+        metrics.recorder.drain()
+
+    def tearDown(self):
+        cache.cache = self.saved
+        self.dir.cleanup()
+
+    def test_failed_span(self):
+        @metrics.instrument
+        def fails():
+            raise ValueError('bad page')
+        with self.assertRaises(ValueError):
+            fails()
+        span, = metrics.recorder.drain()
+        self.assertEqual(span.name, 'TestMetrics.test_failed_span.<locals>.fails')
+        self.assertEqual(span.status, 'error')
+
+    def test_upstream_requests(self):
+        with StubServer(b'{"data": []}', 'application/json',
+                        etag='"v1"') as server:
+            with metrics.span('get_bookings_range'):
+                cache.get('bookings', server.url)
+            cache.TTL['bookings'], ttl = 60, cache.TTL['bookings']
+            try:
+                cache.get('bookings', server.url)
+            finally:
+                cache.TTL['bookings'] = ttl
+        spans = metrics.recorder.drain()
+        self.assertEqual([span.name for span in spans],
+                         ['upstream', 'get_bookings_range', 'upstream'])
+        self.assertEqual(spans[0].attributes['status code'], 200)
+        self.assertEqual(spans[0].attributes['bytes'], 12)
+        self.assertEqual([span.attributes['cache hit'] for span in spans[::2]],
+                         [False, True])
+
+        settings = {'log': self.dir.name + '/runs.jsonl',
+                    'prometheus': self.dir.name + '/mmg.prom'}
+        run = metrics.export(settings, spans)
+        lines = [json.loads(line) for line in open(settings['log'])]
+        self.assertEqual({line['run'] for line in lines}, {run})
+        self.assertEqual(lines[1]['name'], 'get_bookings_range')
+        textfile = open(settings['prometheus']).read()
+        self.assertIn('mmg_upstream_requests{source="bookings"} 2', textfile)
+        self.assertIn('mmg_upstream_cache_hits{source="bookings"} 1', textfile)
+        self.assertIn('mmg_upstream_status_code{source="bookings"} 200',
+                      textfile)
+        self.assertEqual(os.stat(settings['prometheus']).st_mode & 0o777,
+                         0o644)
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.saved = (config.CONFIG, cache.cache, manifest.MANIFEST_PATH,
+                      Tide.URL, weather_api.URL, booking_api.BASE_URL)
+        config.CONFIG = fixtures.load_config(
+            {'archive': self.dir.name + '/archive.sqlite3'})
+        cache.cache = ResponseCache(self.dir.name + '/cache')
+        manifest.MANIFEST_PATH = self.dir.name + '/manifest.json'
+        self.site = Site(None, 'ladysmith', '7460', 'main',
+                         self.dir.name + '/', ('A',))
+        self.morning = datetime.combine(date.today(), datetime.min.time())
+
+    def tearDown(self):
+        (config.CONFIG, cache.cache, manifest.MANIFEST_PATH,
+         Tide.URL, weather_api.URL, booking_api.BASE_URL) = self.saved
+        self.dir.cleanup()
+
+    def test_prefetches_then_generates(self):
+        scheduler = daemon.Daemon([self.site], generate_at=dt_time(6))
+        with stubs.tides_server() as tides, stubs.weather_server() as weather, \
+                stubs.timetree_server() as timetree:
+            Tide.URL = tides.url + '/{station}'
+            weather_api.URL = weather.url
+            booking_api.BASE_URL = timetree.url
+
+            wait = scheduler.tick(self.morning.replace(hour=5))
+            self.assertEqual(wait, daemon.MAX_WAIT)
+            self.assertEqual((tides.requests, weather.requests,
+                              timetree.requests), (1, 1, 0))
+            self.assertIn(date.today() + timedelta(days=1),
+                          scheduler.data['tides:7460'])
+
+            scheduler.tick(self.morning.replace(hour=5, minute=30))
+            self.assertEqual((tides.requests, weather.requests), (1, 1))
+
+            scheduler.tick(self.morning.replace(hour=6))
+            self.assertEqual((tides.requests, weather.requests,
+                              timetree.requests), (1, 1, 1))
+        self.assertTrue(Path(self.site.output_location +
+                             self.site.file_prefix +
+                             date.today().strftime('%d-%m-%y.docx')).exists())
+        self.assertEqual(scheduler.next_run,
+                         self.morning.replace(hour=6) + timedelta(days=1))
+        self.assertEqual(
+            archive.open_archive(config.CONFIG.archive).booking_counts(
+                date.today(), date.today()), [(date.today(), '', 4)])
+
+    def test_keeps_data_when_refresh_fails(self):
+        scheduler = daemon.Daemon([self.site])
+        scheduler.data['weather:ladysmith'] = {date.today(): ['held']}
+        failing = Source('weather:ladysmith', lambda: 1 / 0, default=dict)
+        scheduler.refresh([failing], date.today())
+        self.assertEqual(scheduler.data['weather:ladysmith'],
+                         {date.today(): ['held']})
+        self.assertIn('weather:ladysmith',
+                      [src.name for src in scheduler.due(self.morning)])
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.raw = {'employees': ['A'], 'personal access token': 'token',
+                    'calendar ID': 'main', 'output location': self.dir.name,
+                    'api key': 'key'}
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_valid(self):
+        self.assertEqual(config.validate(self.raw), [])
+
+    def test_problems(self):
+        del self.raw['api key']
+        self.raw['employees'] = 'A'
+        self.raw['sites'] = [{'name': 'crofton', 'output location': '/nowhere'}]
+        self.raw['compression level'] = 12
+        self.raw['template'] = self.dir.name + '/template.docx'
+        self.raw['archive'] = '/nowhere/archive.sqlite3'
+        self.raw['metrics'] = {'log': self.dir.name + '/mmg.log',
+                               'prometheus': '/nowhere/mmg.prom'}
+        self.assertEqual(config.validate(self.raw), [
+            '"employees" in site crofton should be a list',
+            'missing "api key" in site crofton',
+            '"output location" in site crofton /nowhere does not exist',
+            '"compression level" should be a number from 0 to 9',
+            f'"template" {self.dir.name}/template.docx does not exist',
+            'the directory of "archive" /nowhere/archive.sqlite3 does not '
+            'exist',
+            'the directory of "prometheus" in "metrics" /nowhere/mmg.prom '
+            'does not exist'])
+
+    def test_read_only_and_typed(self):
+        import pickle
+        self.raw['sites'] = [{'name': 'crofton', 'tide station': 7455}]
+        loaded = config.Config(self.raw)
+        self.assertEqual(loaded['api key'], loaded.api_key)
+        self.assertEqual(loaded.employees, ('A',))
+        self.assertEqual(loaded.sites[0]['tide station'], 7455)
+        self.assertIsNone(loaded.template)
+        self.assertIsNone(loaded.safety_rules)
+        self.assertEqual((dict(loaded.metrics), dict(loaded.daemon)), ({}, {}))
+        with self.assertRaises(AttributeError):
+            loaded.api_key = 'other'
+        with self.assertRaises(TypeError):
+            loaded.sites[0]['name'] = 'chemainus'
+        self.assertEqual(pickle.loads(pickle.dumps(loaded)), loaded)
+        self.assertEqual(loaded.to_dict(), self.raw)
+
+        self.raw['compression level'] = True
+        self.raw['daemon'] = {'generate at': 'dawn'}
+        with self.assertRaises(config.ConfigError) as raised:
+            config.Config(self.raw)
+        self.assertEqual(raised.exception.problems, [
+            '"compression level" should be an int',
+            '"generate at" in "daemon" should be a time like "06:30"'])
+
+    def test_rule_metrics_and_daemon_problems(self):
+        import rules
+        self.raw['safety rules'] = rules.DEFAULT_RULES + [
+            {'series': 'wnd', 'op': '=>', 'value': 25, 'message': 'm'},
+            {'series': 'wind', 'op': '>', 'value': '25', 'message': '{speed}',
+             'colour': 'red'},
+            {'series': 'uv', 'op': '>', 'value': 3, 'report': 'windows',
+             'hours': [16, 9], 'message': 'from {start}'}]
+        self.raw['metrics'] = {'log': 1, 'prometheus': 'metrics.prom'}
+        self.raw['daemon'] = {'refresh minutes': {'tides': 0, 'tide': 60}}
+        self.assertEqual(config.validate(self.raw), [
+            '"series" in safety rule 4 should be one of temp, uv, wind, tide',
+            '"op" in safety rule 4 should be one of <, <=, >, >=, ==',
+            'safety rule 5 has unknown "colour"',
+            '"value" in safety rule 5 should be an int or float',
+            'safety rule 6 reports windows, which are only reported for the '
+            'tide being above or below a level',
+            '"hours" in safety rule 6 should be the first and last hour e.g. '
+            '[10, 18]',
+            '"log" in "metrics" should be a str',
+            '"tides" in "refresh minutes" should be a number of minutes '
+            'above 0',
+            '"refresh minutes" in "daemon" has "tide", only tides and weather '
+            'are refreshed'])
+
+        # every rule that passes builds in the engine
+        self.raw['safety rules'][3:] = [
+            {'series': 'wind', 'op': '>', 'value': 25.5, 'report': 'runs',
+             'hours': [9, 16], 'message': 'Windy {start} to {end}'}]
+        del self.raw['metrics'], self.raw['daemon']
+        self.assertEqual(config.validate(self.raw), [])
+        self.assertEqual(len(rules.RuleEngine(self.raw['safety rules']).rules),
+                         4)
+
+    def test_load_and_reload(self):
+        saved = config.CONFIG_PATH, config.CONFIG, config._mtime
+        config.CONFIG_PATH = Path(self.dir.name) / 'config.json'
+        config._mtime = None
+        try:
+            config.CONFIG_PATH.write_text(json.dumps(self.raw))
+            config.load()
+            self.assertEqual(config.CONFIG.api_key, 'key')
+            self.assertFalse(config.reload())
+
+            config.CONFIG_PATH.write_text(json.dumps({**self.raw, 'api key': 1}))
+            os.utime(config.CONFIG_PATH, ns=(0, config._mtime + 1))
+            self.assertFalse(config.reload())
+            self.assertEqual(config.CONFIG.api_key, 'key')
+
+            config.CONFIG_PATH.write_text(json.dumps({**self.raw, 'api key': 'new'}))
+            os.utime(config.CONFIG_PATH, ns=(0, config._mtime + 1))
+            self.assertTrue(config.reload())
+            self.assertEqual(config.CONFIG.api_key, 'new')
+
+            config.CONFIG_PATH.write_text(json.dumps({'employees': []}))
+            with self.assertRaises(SystemExit):
+                config._mtime = None
+                config.load()
+        finally:
+            config.CONFIG_PATH, config.CONFIG, config._mtime = saved
+
+    def test_cli_doesnt_import_heavy_modules(self):
+        import subprocess, sys
+        result = subprocess.run([sys.executable, '-c',
+            'import sys, main; print([name for name in '
+            '("requests", "numpy", "docx") if name in sys.modules])'],
+            capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.saved = (config.CONFIG, cache.cache, Tide.URL, weather_api.URL,
+                      booking_api.BASE_URL)
+        config.CONFIG = fixtures.load_config()
+        cache.cache = ResponseCache(self.dir.name + '/cache')
+        self.service = server.MeetingService([
+            Site(None, 'ladysmith', '7460', 'main', '', ('A', 'B'))])
+
+    def tearDown(self):
+        (config.CONFIG, cache.cache, Tide.URL, weather_api.URL,
+         booking_api.BASE_URL) = self.saved
+        self.service.executor.shutdown()
+        self.dir.cleanup()
+
+    async def get(self, port: int, target: str) -> tuple[int, bytes]:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {target} HTTP/1.1\r\nHost: test\r\n\r\n'.encode())
+        response = await reader.read()
+        writer.close()
+        head, body = response.split(b'\r\n\r\n', 1)
+        return int(head.split()[1]), body
+
+    async def requests(self, targets: list[str]) -> list[tuple[int, bytes]]:
+        listener = await asyncio.start_server(self.service.handle,
+                                              '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            return await asyncio.gather(*(self.get(port, target)
+                                          for target in targets))
+
+    def test_concurrent_requests_share_fetches_and_render(self):
+        with stubs.tides_server(0.2) as tides, stubs.weather_server(0.2) as weather, \
+                stubs.timetree_server(0.2) as timetree:
+            Tide.URL = tides.url + '/{station}'
+            weather_api.URL = weather.url
+            booking_api.BASE_URL = timetree.url
+            tomorrow = date.today() + timedelta(days=1)
+            responses = asyncio.run(self.requests(
+                ['/meetings/today.docx'] * 5 + ['/meetings/today',
+                                                f'/meetings/{tomorrow}']))
+            self.assertEqual((tides.requests, weather.requests,
+                              timetree.requests), (1, 1, 1))
+
+            # a later request is answered from memory, without rendering
+            self.service._render = None
+            status, body = asyncio.run(self.requests(
+                [f'/meetings/{date.today()}.docx']))[0]
+            self.assertEqual(timetree.requests, 1)
+
+        self.assertEqual({status for status, _ in responses}, {200})
+        self.assertEqual(len({body for _, body in responses[:5]}), 1)
+        self.assertEqual(body, responses[0][1])
+        self.assertTrue(body.startswith(b'PK'))
+        meeting = json.loads(responses[5][1])
+        self.assertEqual(meeting['day'], date.today().isoformat())
+        self.assertEqual(len(meeting['weather']), 9)
+        self.assertIn('Wear sunscreen. The UV-index is high today from 10 AM '
+                      'until 5 PM', meeting['safety topics'])
+        self.assertEqual(json.loads(responses[6][1])['bookings'][0]['title'],
+                         'Staff day 15')
+
+        # spans are held until exported, and only once something is fetched
+        textfile = Path(self.dir.name) / 'mmg.prom'
+        config.CONFIG = fixtures.load_config(
+            {'metrics': {'prometheus': str(textfile)}})
+        self.assertTrue(self.service.export_metrics())
+        self.assertEqual(metrics.recorder.spans, [])
+        self.assertIn('mmg_upstream_requests{source="bookings"}',
+                      textfile.read_text())
+        asyncio.run(self.requests(['/health', '/meetings/today']))
+        self.assertFalse(self.service.export_metrics())
+        self.assertIn('mmg_upstream_requests{source="bookings"}',
+                      textfile.read_text())
+        metrics.recorder.drain()
+
+    def test_errors(self):
+        responses = asyncio.run(self.requests([
+            '/meetings/1999-01-01', '/nowhere', '/meetings/today?site=crofton',
+            '/health']))
+        self.assertEqual([status for status, _ in responses],
+                         [404, 404, 404, 200])
+
+
+class TestUpstreamSources(unittest.TestCase):
+
+    def setUp(self):
+        self.config = config.CONFIG
+        self.sites = {'sites': [
+            {'name': 'ladysmith'},
+            {'name': 'chemainus', 'location': 'chemainus',
+             'tide station': '7455', 'employees': ['B']},
+            {'name': 'crofton', 'location': 'chemainus',
+             'calendar ID': 'crofton'},
+        ]}
+        config.CONFIG = fixtures.load_config(self.sites)
+
+    def tearDown(self):
+        config.CONFIG = self.config
+
+    def test_sites_inherit_top_level_config(self):
+        config.CONFIG = fixtures.load_config({**self.sites,
+                                              'forecast hours': [9, 17]})
+        ladysmith, chemainus, crofton = load_sites()
+        self.assertEqual(crofton.forecast_hours, (9, 17))
+        self.assertEqual((ladysmith.location, ladysmith.station),
+                         ('ladysmith', '7460'))
+        self.assertEqual(chemainus.employees, ('B',))
+        self.assertEqual(crofton.calendar_id, 'crofton')
+        self.assertEqual(crofton.file_prefix, 'morning_meeting_crofton_')
+
+    def test_shared_upstreams_fetched_once(self):
+        names = [src.name for src in mmg.upstream_sources(load_sites())]
+        self.assertEqual(sorted(names), [
+            'bookings:crofton', 'bookings:main', 'tides:7455', 'tides:7460',
+            'weather:chemainus', 'weather:ladysmith'])
+
+
+class TestUpstreamClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = upstream.Client(retries=2, backoff=0.01,
+                                      breaker_threshold=2, breaker_reset=60)
+
+    def test_retries_server_errors(self):
+        with StubServer(b'ok', 'text/plain', errors=2) as server:
+            res = self.client.get(server.url)
+            self.assertEqual(server.requests, 3)
+        self.assertEqual(res.content, b'ok')
+        self.assertEqual(len(self.client.latencies()), 3)
+
+    def test_gives_up_after_retries(self):
+        with StubServer(b'ok', 'text/plain', errors=5) as server:
+            res = self.client.get(server.url)
+            self.assertEqual(server.requests, 3)
+        self.assertEqual(res.status_code, 503)
+
+    def test_times_out(self):
+        with StubServer(b'ok', 'text/plain', delay=0.5) as server:
+            with self.assertRaises(requests.Timeout):
+                self.client.get(server.url, timeout=0.1)
+            self.assertEqual(server.requests, 3)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        with StubServer(b'ok', 'text/plain', errors=6) as server:
+            self.client.get(server.url)
+            self.client.get(server.url)
+            with self.assertRaises(upstream.CircuitOpenError):
+                self.client.get(server.url)
+            self.assertEqual(server.requests, 6)
+
+
+class TestIconStore(unittest.TestCase):
+
+    def test_repeated_icons_share_a_part(self):
+        from docx import Document
+        from docx.shared import Inches
+        document = Document()
+        store = IconStore(document)
+        paragraph = document.add_paragraph()
+        emojis = ['/weather/64x64/day/113.png', '/weather/64x64/day/116.png']
+        for emoji in emojis * 3:
+            store.add_picture(paragraph.add_run(), emoji, Inches(.35))
+
+        self.assertEqual(len(document.inline_shapes), 6)
+        self.assertEqual(len(document.part.package.image_parts), 2)
+        rIds = {shape._inline.graphic.graphicData.pic.blipFill.blip.embed
+                for shape in document.inline_shapes}
+        self.assertEqual(len(rIds), 2)
+
+
+class TestTemplateRendering(unittest.TestCase):
+
+    def render(self, method, data):
+        site = Site(None, 'ladysmith', '7460', 'main', '', ('A', 'B'))
+        meeting_doc = mmg.MeetingDocumentGenerator(date.today(), data, site)
+        getattr(meeting_doc, method)()
+        document = meeting_doc.document
+        return ([p.text for p in document.paragraphs],
+                [[cell.text for cell in row.cells]
+                 for table in document.tables for row in table.rows],
+                len(document.inline_shapes))
+
+    def test_matches_generated_document(self):
+        data = fixtures.meeting_data()
+        self.assertEqual(self.render('generate_from_template', data),
+                         self.render('generate', data))
+
+    def test_weather_columns_fit_forecast(self):
+        data = fixtures.meeting_data()
+        data['weather'] = data['weather'][:4]
+        self.assertEqual(self.render('generate_from_template', data),
+                         self.render('generate', data))
+
+
+class TestOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        site = Site(None, 'ladysmith', '7460', 'main', self.dir.name + '/',
+                    ('A', 'B'))
+        self.meeting_doc = mmg.MeetingDocumentGenerator(
+            date.today(), fixtures.meeting_data(), site)
+        self.meeting_doc.generate_from_template()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_compression_levels(self):
+        import docx, io
+        sizes = {}
+        for level in (0, 1, 9):
+            buffer = io.BytesIO()
+            output.save(self.meeting_doc.document, buffer, level)
+            sizes[level] = len(buffer.getvalue())
+            reopened = docx.Document(buffer)
+            self.assertEqual(reopened.tables[2].rows[0].cells[1].text,
+                             self.meeting_doc.bookings[0].title)
+        self.assertGreater(sizes[0], sizes[1])
+        self.assertGreater(sizes[1], sizes[9])
+
+    def test_failed_save_keeps_previous_document(self):
+        path = self.meeting_doc.write_to_file()
+        previous = Path(path).read_bytes()
+        from unittest import mock
+        with mock.patch.object(output.PackageWriter, '_write_parts',
+                               side_effect=OSError('No space left on device')):
+            with self.assertRaises(OSError):
+                output.save(self.meeting_doc.document, path, level=1)
+        self.assertEqual(Path(path).read_bytes(), previous)
+        self.assertEqual(list(Path(self.dir.name).iterdir()), [Path(path)])
+
+    def test_saved_file_mode(self):
+        path = self.meeting_doc.write_to_file()
+        opened = Path(self.dir.name) / 'opened'
+        opened.touch()
+        self.assertEqual(os.stat(path).st_mode & 0o777,
+                         opened.stat().st_mode & 0o777)
+        opened.unlink()
+        os.chmod(path, 0o640)
+        output.save(self.meeting_doc.document, path)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+
+    def test_renders_in_worker_processes(self):
+        jobs = [(date.today() + timedelta(days=i), fixtures.meeting_data(),
+                 self.meeting_doc.site, None) for i in range(2)]
+        with mmg.worker_pool(len(jobs)) as pool:
+            paths = mmg._render_all(pool, jobs)
+        self.assertEqual(len(set(paths)), 2)
+        self.assertTrue(all(Path(path).exists() for path in paths))
+
+    def test_write_to_buffer(self):
+        import io
+        buffer = io.BytesIO()
+        self.assertIsNone(self.meeting_doc.write_to_file(buffer))
+        self.assertTrue(buffer.getvalue().startswith(b'PK'))
+        self.assertEqual(list(Path(self.dir.name).iterdir()), [])
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.archive = archive.Archive(self.dir.name + '/archive.sqlite3')
+        self.day = date.today()
+        self.data = fixtures.meeting_data(self.day)
+        self.topics = mmg.MeetingDocumentGenerator(
+            self.day, self.data, Site(None, 'ladysmith', '7460', 'main', '',
+                                      ('A',))).safety_topics.topics
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_range_queries(self):
+        tomorrow = self.day + timedelta(days=1)
+        self.archive.append('crofton', self.day, self.data, self.topics)
+        self.archive.append('crofton', tomorrow,
+                            {**self.data, 'bookings': []}, [])
+        self.archive.flush()
+        self.assertEqual(self.archive.booking_counts(self.day, tomorrow),
+                         [(self.day, 'crofton', 4), (tomorrow, 'crofton', 0)])
+        self.assertEqual(self.archive.tide_summary(self.day, self.day),
+                         [(self.day, 'crofton', -0.1, 4.4)])
+        self.assertEqual(self.archive.weather_summary(self.day, self.day),
+                         [(self.day, 'crofton', 22, 31, 8.0)])
+        self.assertEqual(self.archive.low_tide_days(0.6, self.day, tomorrow),
+                         [self.day, tomorrow])
+        self.assertEqual(self.archive.topic_days('Woods Island', self.day,
+                                                 tomorrow, 'crofton'),
+                         [self.day])
+        self.assertEqual(self.archive.topic_days('Woods Island', self.day,
+                                                 tomorrow, 'main'), [])
+
+    def test_latest_snapshot(self):
+        self.archive.append(None, self.day, self.data, self.topics)
+        self.archive.append(None, self.day,
+                            {**self.data, 'bookings': self.data['bookings'][:1]},
+                            self.topics)
+        self.archive.flush()
+        self.assertEqual(self.archive.booking_counts(self.day, self.day),
+                         [(self.day, '', 1)])
+        snapshots, = self.archive.query('SELECT count(*) FROM snapshots')
+        self.assertEqual(snapshots, (2,))
+
+    def test_reruns_only_archive_what_changed_and_was_fetched(self):
+        saved = config.CONFIG, manifest.MANIFEST_PATH
+        config.CONFIG = fixtures.load_config({'archive': str(self.archive.path)})
+        manifest.MANIFEST_PATH = self.dir.name + '/manifest.json'
+        site = Site(None, 'ladysmith', '7460', 'main', self.dir.name + '/',
+                    ('A',))
+        forecast = json.loads(fixtures.load('weather_forecast.json', self.day))
+        data = {
+            'tides:7460': {self.day: self.data['tides']},
+            'weather:ladysmith': Forecast.from_api_days(
+                forecast['forecast']['forecastday']),
+            'bookings:main': {self.day: self.data['bookings']},
+        }
+        snapshots = 'SELECT count(*) FROM snapshots'
+        try:
+            mmg.write_documents(data, self.day, 1, [site])
+            mmg.write_documents(data, self.day, 1, [site])
+            self.assertEqual(self.archive.query(snapshots), [(1,)])
+
+            # the tides couldn't be fetched, the document changes but the
+            # archived tides and topics are still the last ones fetched
+            mmg.write_documents({**data, 'tides:7460': {}}, self.day, 1,
+                                [site])
+        finally:
+            config.CONFIG, manifest.MANIFEST_PATH = saved
+        self.assertEqual(self.archive.query(snapshots), [(2,)])
+        self.assertEqual(self.archive.tide_summary(self.day, self.day),
+                         [(self.day, '', -0.1, 4.4)])
+        self.assertEqual(self.archive.low_tide_days(0.6, self.day, self.day),
+                         [self.day])
+        self.assertEqual(self.archive.topic_days('Woods Island', self.day,
+                                                 self.day), [self.day])
+        self.assertEqual(self.archive.booking_counts(self.day, self.day),
+                         [(self.day, '', 4)])
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.site = Site(None, 'ladysmith', '7460', 'main',
+                         self.dir.name + '/', ('A', 'B'))
+        self.data = fixtures.meeting_data()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def sections(self):
+        meeting_doc = mmg.MeetingDocumentGenerator(date.today(), self.data,
+                                                   self.site)
+        return meeting_doc.path, meeting_doc.section_hashes()
+
+    def test_reports_changed_sections(self):
+        manifest = Manifest(self.dir.name + '/manifest.json')
+        path, sections = self.sections()
+        self.assertEqual(manifest.changed(path, sections), list(sections))
+
+        open(path, 'w').close()
+        manifest.update(path, sections)
+        manifest.save()
+        manifest = Manifest(self.dir.name + '/manifest.json')
+        self.assertEqual(manifest.changed(*self.sections()), [])
+
+        self.data['bookings'] = self.data['bookings'][1:]
+        self.assertEqual(manifest.changed(*self.sections()), ['bookings'])
+
+
+class OriginalSafetyTopics(SafetyTopics):
+    '''the hard coded checks rules.DEFAULT_RULES replaced, as they were'''
+
+    def _fill(self):
+        self.heat_exhaustion()
+        self.tide_too_low_for_woods()
+        self.uv_index()
+
+    def heat_exhaustion(self):
+        if self.doc.weather and \
+                any(hour.temp >= 30 for hour in self.doc.weather):
+            pt1 = 'Watch out for Heat Exhaustion. Alternate staff working'
+            pt2 = ' in the sun, drink plenty of water'
+            self.topics.append(pt1 + pt2)
+
+    def tide_too_low_for_woods(self):
+        woods_inaccessible = [tide for tide in self.doc.tides['hourly'] if
+                              tide.is_too_low_for_woods()]
+        if any(tide.is_within_operational_hours()
+               for tide in woods_inaccessible):
+            start = woods_inaccessible[0].time.strftime('%I %p').strip('0')
+            end = woods_inaccessible[-1].time.strftime('%I %p').strip('0')
+            pt1 = 'Tides too low to access channel behind Woods Island'
+            pt2 = f' from {start} to {end}'
+            self.topics.append(pt1 + pt2)
+
+    def uv_index(self):
+        danger = 3
+        dangerous_hours = list(filter(lambda hr: hr.uv >= danger,
+                                      self.doc.weather))
+        if len(dangerous_hours) > 0:
+            for split in split_hours(dangerous_hours):
+                start = split[0].date.strftime('%I %p').strip('0')
+                end = split[-1].date.strftime('%I %p').strip('0')
+                self.topics.append('Wear sunscreen. The UV-index is high '
+                                   f'today from {start} until {end}')
+
+
+class TestRuleEngineParity(unittest.TestCase):
+
+    def topics(self, data):
+        '''topics from the rule engine and from the original checks'''
+        doc = mmg.MeetingDocumentGenerator(date.today(), data,
+            Site(None, 'ladysmith', '7460', 'main', '', ()))
+        return doc.safety_topics.topics, OriginalSafetyTopics(doc).topics
+
+    def assertParity(self, data):
+        # the original checks only had the hourly tides, which the engine
+        # falls back to when a day has no highs and lows
+        data['tides']['high and low'] = []
+        engine, original = self.topics(data)
+        self.assertEqual(engine, original)
+        return engine
+
+    def test_fixture_days(self):
+        for i in range(3):
+            data = fixtures.meeting_data()
+            data['weather'] = [Weather(hr.date, hr.description, hr.emoji,
+                                       hr.temp - 3 * i, hr.wind, hr.uv)
+                               for hr in data['weather']]
+            self.assertParity(data)
+
+    def test_split_uv_and_no_heat(self):
+        data = fixtures.meeting_data()
+        uv = [1, 4, 5, 2, 3, 1, 6, 6, 2]
+        data['weather'] = [Weather(hr.date, hr.description, hr.emoji, 20,
+                                   hr.wind, uv[i])
+                           for i, hr in enumerate(data['weather'])]
+        topics = self.assertParity(data)
+        self.assertEqual(len(topics), 4)
+
+    def test_low_tide_outside_operational_hours(self):
+        data = fixtures.meeting_data()
+        data['tides']['hourly'] = [
+            Tide.Tide(tide.time, 0.5 if tide.time.hour < 6 else 2.0, None)
+            for tide in data['tides']['hourly']]
+        topics = self.assertParity(data)
+        self.assertFalse(any('Woods' in topic for topic in topics))
+
+        midnight = timestamps.midnight()
+        data['tides']['high and low'] = [
+            Tide.Tide(midnight + timedelta(hours=hour), meters, None)
+            for hour, meters in ((2, 0.2), (8, 3.9), (14, 1.2), (20, 4.1))]
+        engine, _ = self.topics(data)
+        self.assertFalse(any('Woods' in topic for topic in engine))
+
+    def test_low_tide_windows(self):
+        midnight = timestamps.midnight()
+        data = fixtures.meeting_data()
+        data['tides']['high and low'] = [
+            Tide.Tide(midnight + timedelta(hours=hour), meters, None)
+            for hour, meters in ((3, 3.0), (9, 0.2), (12, 1.0), (15, 0.4),
+                                 (21, 4.0))]
+        engine, _ = self.topics(data)
+        self.assertEqual(
+            [topic for topic in engine if 'Woods' in topic],
+            ['Tides too low to access channel behind Woods Island '
+             'from 7:31 AM to 10:30 AM',
+             'Tides too low to access channel behind Woods Island '
+             'from 1:49 PM to 3:54 PM'])
+
+    def test_low_tide_window_past_last_high_or_low(self):
+        midnight = timestamps.midnight()
+        data = fixtures.meeting_data()
+        data['tides']['high and low'] = [
+            Tide.Tide(midnight + timedelta(hours=hour), meters, None)
+            for hour, meters in ((2, 4.0), (8, 1.5), (14, 0.2))]
+        data['tides']['neighbours'] = [
+            Tide.Tide(midnight + timedelta(hours=hour), meters, None)
+            for hour, meters in ((-4, 1.0), (26, 4.0))]
+        engine, _ = self.topics(data)
+        self.assertEqual(
+            [topic for topic in engine if 'Woods' in topic],
+            ['Tides too low to access channel behind Woods Island '
+             'from 11:45 AM to 4:31 PM'])
+
+    def test_no_data(self):
+        data = {'tides': {'high and low': [], 'hourly': [], 'neighbours': []},
+                'weather': [], 'bookings': []}
+        self.assertEqual(self.assertParity(data), [])
+
+    def test_rules_from_config(self):
+        engine = rules.RuleEngine([{
+            'series': 'wind', 'op': '>=', 'value': 15, 'report': 'runs',
+            'message': 'Windy from {start} until {end}'}])
+        data = fixtures.meeting_data()
+        series = rules.day_series(data['weather'], data['tides']['hourly'])
+        self.assertEqual(engine.evaluate(series),
+                         ['Windy from 12 PM until 1 PM'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+"""
+tide heights between the highs and lows
+
+the station page's hourly heights are only accurate to the hour, so the
+channel behind Woods Island is reported closed from the first to the last
+low hour. TideCurve follows half a cosine from each high or low to the next,
+the usual way tide tables are interpolated by hand, which gives the height
+at every minute and the exact times the tide crosses a level. Each half
+cosine only rises or falls, so a crossing is solved directly rather than
+searched for, for every high and low of a season at once.
+"""
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+
+class TideCurve:
+
+    def __init__(self, extremes: list):
+        '''
+        extremes: the highs and lows, Tides as parse_high_and_low_tides
+                  returns, over one or more consecutive days
+        '''
+        extremes = sorted((tide for tide in extremes
+                           if tide.meters is not None),
+                          key=lambda tide: tide.time)
+        self.start: datetime = extremes[0].time if extremes else None
+
+        # minutes since start and height of each high and low
+        self.times = np.array([(tide.time - self.start).total_seconds() / 60
+                               for tide in extremes])
+        self.meters = np.array([tide.meters for tide in extremes],
+                               dtype=np.float64)
+
+        # height at each whole minute from the first high or low to the last
+        self.heights = self._heights(
+            np.arange(np.ceil(self.times[-1]) + 1) if len(self) else
+            np.empty(0))
+
+    @classmethod
+    def from_days(cls, tides: dict[date, dict]) -> 'TideCurve':
+        '''one curve through the days get_tide_range returns'''
+        return cls([tide for day in sorted(tides)
+                    for tide in tides[day]['high and low']])
+
+    def __len__(self):
+        '''number of highs and lows, a curve needs at least two'''
+        return len(self.times) if len(self.times) > 1 else 0
+
+    def _heights(self, minutes: np.ndarray) -> np.ndarray:
+        segment = np.clip(np.searchsorted(self.times, minutes, 'right') - 1,
+                          0, len(self.times) - 2)
+        t0, t1 = self.times[segment], self.times[segment + 1]
+        h0, h1 = self.meters[segment], self.meters[segment + 1]
+        return (h0 + h1) / 2 + (h0 - h1) / 2 * np.cos(np.pi * (minutes - t0)
+                                                      / (t1 - t0))
+
+    def height(self, when: datetime) -> float:
+        '''height at when, NaN outside the first and last high or low'''
+        minute = round((when - self.start).total_seconds() / 60) \
+            if len(self) else -1
+        if not 0 <= minute < len(self.heights):
+            return float('nan')
+        return float(self.heights[minute])
+
+    def windows(self, level: float, below: bool = True,
+                hours: tuple[int, int] = None) -> list[tuple[datetime, datetime]]:
+        '''
+        The (start, end) of each stretch where the tide is at or below
+        level, or at or above it when below is False. Stretches reaching
+        the first or last high or low are cut off there.
+        hours: only the stretches overlapping the hours from first:00 to
+               last:59 of their day
+        '''
+        if not len(self):
+            return []
+        meters, level = (self.meters, level) if below else \
+            (-self.meters, -level)
+        inside = meters <= level
+        t0, t1 = self.times[:-1], self.times[1:]
+        h0, h1 = meters[:-1], meters[1:]
+
+        # solve mid + amp * cos(pi * x) = level on the segments it crosses
+        crosses = inside[:-1] != inside[1:]
+        mid, amp = (h0 + h1) / 2, (h0 - h1) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = np.arccos(np.clip((level - mid) / amp, -1, 1)) / np.pi
+        at = t0 + x * (t1 - t0)
+
+        starts = at[crosses & inside[1:]]
+        ends = at[crosses & inside[:-1]]
+        if inside[0]:
+            starts = np.concatenate(([self.times[0]], starts))
+        if inside[-1]:
+            ends = np.concatenate((ends, [self.times[-1]]))
+
+        windows = [(self._time(start), self._time(end))
+                   for start, end in zip(starts, ends) if end > start]
+        if hours is None:
+            return windows
+        first, last = hours
+        return [(start, end) for start, end in windows
+                if start < _at(start, last + 1) and end > _at(start, first)]
+
+    def _time(self, minutes: float) -> datetime:
+        '''minutes since start as a time, to the nearest second'''
+        return self.start + timedelta(seconds=round(minutes * 60))
+
+
+def _at(day: datetime, hour: int) -> datetime:
+    return datetime.combine(day.date(), datetime.min.time()) + \
+        timedelta(hours=hour)
@@ -0,0 +1,71 @@
+"""
+fast parsing for the timestamp formats the upstreams emit
+
+tides.gc.ca     '03:43' (24 hour clock, the date comes from the table)
+WeatherAPI      '2023-06-14 10:00'
+TimeTree        '2023-06-14T16:00:00.000Z'
+
+dateparser is slow to import and slow per call, so it is only imported when
+a string doesn't match the expected format.
+
+today() is date.today() unless it has been pinned to another day, which
+replaying recorded responses does so the pipeline runs as it did the day
+they were recorded.
+"""
+
+from datetime import date, datetime, time, timezone
+import re
+
+
+CLOCK = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([AaPp][Mm])?')
+
+_pinned: date = None
+
+
+def today() -> date:
+    return _pinned or date.today()
+
+
+def pin(day: date = None):
+    '''make today() return day, or the real date again when day is None'''
+    global _pinned
+    _pinned = day
+
+
+def midnight(day: date = None) -> datetime:
+    '''equivalent of dateparser.parse('midnight today')'''
+    return datetime.combine(day or today(), time())
+
+
+def parse_clock(text: str, day: date = None) -> datetime:
+    '''
+    Parse a time of day such as '03:43', '3:43 PM' or '03:43:10' on day
+    '''
+    match = CLOCK.fullmatch(text.strip())
+    if not match:
+        return _fallback(text)
+    hour, minute, second, meridiem = match.groups()
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+    return datetime.combine(day or today(),
+                            time(hour, int(minute), int(second or 0)))
+
+
+def parse_iso(text: str) -> datetime:
+    '''
+    Parse an ISO 8601 timestamp, with or without a UTC offset
+    such as '2023-06-14 10:00' or '2023-06-14T16:00:00.000Z'
+    '''
+    try:
+        if text.endswith('Z'):
+            return datetime.fromisoformat(text[:-1]) \
+                .replace(tzinfo=timezone.utc)
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return _fallback(text)
+
+
+def _fallback(text: str) -> datetime:
+    import dateparser
+    return dateparser.parse(text)
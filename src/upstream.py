@@ -0,0 +1,176 @@
+"""
+shared HTTP client for tides.gc.ca, WeatherAPI and TimeTree
+
+every upstream request goes through a single Client, which
+  - pools and keeps alive connections with one requests session
+  - applies a timeout per host
+  - retries connection errors, timeouts and 429/5xx responses a bounded
+    number of times with jittered exponential backoff
+  - stops calling a host which keeps failing (circuit breaker) until
+    BREAKER_RESET seconds have passed
+  - records the latency of every request
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# (connect, read) timeouts in seconds, for a single attempt
+HOST_TIMEOUTS = {
+    'tides.gc.ca': (3.05, 10),
+    'api.weatherapi.com': (3.05, 5),
+    'timetreeapis.com': (3.05, 5),
+}
+DEFAULT_TIMEOUT = (3.05, 10)
+
+RETRIES = 2
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# seconds, doubled after every attempt
+BACKOFF = 0.5
+MAX_BACKOFF = 8
+
+# consecutive failed requests before a host is cut off, and for how long
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 60
+
+
+class CircuitOpenError(requests.ConnectionError):
+    '''raised instead of calling a host which has been failing'''
+
+
+@dataclass
+class RequestRecord:
+    host: str
+    url: str
+    # None when no response was received
+    status_code: int
+    seconds: float
+    attempt: int
+
+
+class CircuitBreaker:
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD,
+                 reset: float = BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        '''
+        True when requests may be made, after reset seconds a single
+        request is let through to see if the host has recovered
+        '''
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset:
+                # half open, the next failure opens it again straight away
+                self.opened_at = None
+                self.failures = self.threshold - 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class Client:
+
+    def __init__(self, pool_size: int = 10, retries: int = RETRIES,
+                 backoff: float = BACKOFF, timeouts: dict = None,
+                 breaker_threshold: int = BREAKER_THRESHOLD,
+                 breaker_reset: float = BREAKER_RESET):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeouts = HOST_TIMEOUTS if timeouts is None else timeouts
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.records: deque[RequestRecord] = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def get(self, url: str, params: dict = None, headers: dict = None,
+            timeout=None) -> requests.Response:
+        '''
+        GET url, retrying failures. timeout overrides the host's timeout
+        Raises CircuitOpenError if the host is being cut off
+        '''
+        parts = urlsplit(url)
+        breaker = self.breaker(parts.netloc)
+        if not breaker.allow():
+            raise CircuitOpenError(f'{parts.netloc} is failing, not retrying '
+                                   f'for {self.breaker_reset}s')
+        timeout = timeout or self.timeouts.get(parts.hostname, DEFAULT_TIMEOUT)
+
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                res = self.session.get(url, params=params, headers=headers,
+                                       timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(parts.netloc, url, None, start, attempt)
+                if attempt == self.retries:
+                    breaker.record_failure()
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+
+            self._record(parts.netloc, url, res.status_code, start, attempt)
+            if res.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return res
+            if attempt == self.retries:
+                breaker.record_failure()
+                return res
+            time.sleep(self._delay(attempt, res.headers.get('Retry-After')))
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.breaker_threshold,
+                                                     self.breaker_reset)
+            return self.breakers[host]
+
+    def latencies(self, host: str = None) -> list[float]:
+        '''seconds taken by each recorded request, optionally for one host'''
+        return [record.seconds for record in list(self.records)
+                if host is None or record.host == host]
+
+    def _record(self, host, url, status_code, start, attempt):
+        self.records.append(RequestRecord(host, url, status_code,
+                                          time.perf_counter() - start, attempt))
+
+    def _delay(self, attempt: int, retry_after: str = None) -> float:
+        '''full jitter backoff, or the server's Retry-After when it sends one'''
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), MAX_BACKOFF)
+        return random.uniform(0, min(self.backoff * 2 ** attempt, MAX_BACKOFF))
+
+
+client = Client()